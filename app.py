@@ -1,12 +1,34 @@
 import streamlit as st
 import pandas as pd
-from PIL import Image
-import time, random
-from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, JsCode
+import os, time
 
+import inference_server as infs
 import model_helper as mh
-import recipe_scraper as scraper
-import recipe_parser as parser
+import prediction_cache as pc
+import recipe_search
+import recipe_frames as frames
+import recipe_index as ri
+import recipe_selector as selector
+import scrape_jobs as jobs
+import search_cache as sc
+import telemetry
+import upload_cache as uc
+
+# Set to a converted .tflite file (see convert_model.py) to serve the quantized backend instead of keras
+MODEL_FILE = os.environ.get('PRODUCERECIPE_MODEL', 'resnetv2_250_cls_92_acc.hdf5')
+# Optional directory for the on-disk prediction cache tier, shared across sessions and restarts
+PRED_CACHE_DIR = os.environ.get('PRODUCERECIPE_PRED_CACHE_DIR')
+# How long the shared inference server waits to coalesce requests from concurrent sessions into one batch
+INFERENCE_MAX_WAIT_MS = float(os.environ.get('PRODUCERECIPE_INFERENCE_MAX_WAIT_MS', 10))
+INFERENCE_MAX_BATCH = int(os.environ.get('PRODUCERECIPE_INFERENCE_MAX_BATCH', 32))
+# Background scrape workers (each keeps its own browser pool), bound on queued jobs, and UI poll interval
+SCRAPE_WORKERS = int(os.environ.get('PRODUCERECIPE_SCRAPE_WORKERS', 2))
+SCRAPE_MAX_PENDING = int(os.environ.get('PRODUCERECIPE_SCRAPE_MAX_PENDING', 16))
+SCRAPE_POLL_SECONDS = float(os.environ.get('PRODUCERECIPE_SCRAPE_POLL_SECONDS', 1))
+# Per-session memory for decoded uploads (thumbnail + model input), least recently used uploads are dropped first
+UPLOAD_BUDGET_BYTES = int(float(os.environ.get('PRODUCERECIPE_UPLOAD_BUDGET_MB', 32)) * 2**20)
+# Finished recipe tables kept in the process-wide memo, shared by all sessions
+RECIPE_DF_MEMO_ENTRIES = int(os.environ.get('PRODUCERECIPE_RECIPE_DF_MEMO_ENTRIES', 64))
 
 # Main title headers
 # st.set_page_config(layout="wide")
@@ -35,10 +57,17 @@ st.markdown(hide_st_style, unsafe_allow_html=True)
 
 @st.cache(allow_output_mutation=True)
 def load_resnet_model():
-    loaded_model = mh.load_saved_model('resnetv2_250_cls_92_acc.hdf5')
+    loaded_model = mh.load_saved_model(MODEL_FILE)
     return loaded_model
 
 
+@st.cache(allow_output_mutation=True)
+def load_inference_server():
+    return infs.InferenceServer(load_resnet_model(),
+                                max_batch_size=INFERENCE_MAX_BATCH,
+                                max_wait_ms=INFERENCE_MAX_WAIT_MS)
+
+
 def create_image_grid(len_images, n_cols):
     n_rows = 1 + len_images // int(n_cols)
     rows = [st.container() for _ in range(n_rows)]
@@ -49,70 +78,79 @@ def create_image_grid(len_images, n_cols):
 
 @st.experimental_memo(suppress_st_warning=True)
 def process_predictions_to_df(pred_dict):
+    return frames.predictions_frame(pred_dict)
 
-    def calc_confidence(row):
-        if row['probability'] < 0.33:
-            return 'Low'
-        elif 0.33 <= row['probability'] <= 0.66:
-            return 'Medium'
-        else:
-            return 'High'
 
-    df = pd.DataFrame(pred_dict)
-    df['probability'] = df['probability'].astype(float)
-    df['confidence'] = df.apply(calc_confidence, axis=1)
+def build_scrape_query(pred_dict, cuisine_opt, engine_opt, limit_opt, ignore_opt):
+    # Build a new list rather than deleting from pred_dict, which is still being rendered
+    ingredients = [pred for pred, prob in zip(pred_dict['prediction'], pred_dict['probability'])
+                   if not ignore_opt or float(prob) >= 0.33]
 
-    return df
+    # Google always returns ~15 results, so the limit is not part of its cache key
+    limit = limit_opt if engine_opt != 'Google' else None
+    return tuple(sorted(set(ingredients))), cuisine_opt, engine_opt, limit
 
 
-@st.cache(allow_output_mutation=True)
-def scrape_recipes(pred_dict, cuisine_opt, engine_opt, limit_opt, ignore_opt):
-
-    def filter_preds():
-        for idx, prob in enumerate(pred_dict['probability']):
-            if float(prob) < 0.33:
-                del pred_dict['filename'][idx]
-                del pred_dict['prediction'][idx]
-                del pred_dict['probability'][idx]
-
-    if ignore_opt:
-        filter_preds()
-
-    if engine_opt == 'Google':
-        recipe_dict = scraper.scrape_recipes_google(pred_dict['prediction'], cuisine_opt)
-    else:
-        recipe_dict = scraper.scrape_recipes_bing(pred_dict['prediction'], cuisine_opt, limit_opt)
+def get_cached_recipes(query):
+    # This session's copy first, then the persistent store shared across sessions and replicas,
+    # then the ingredient index built from earlier scrapes of other combinations
+    if query in st.session_state.recipe_results:
+        telemetry.count('search_cache', result='session')
+        return st.session_state.recipe_results[query]
+
+    ingredients, cuisine_opt, engine_opt, limit_opt = query
+    recipe_dict = None
+    search_cache = sc.get_search_cache()
+    if search_cache is not None:
+        recipe_dict = search_cache.get(list(ingredients), cuisine_opt, engine_opt, limit_opt)
+        telemetry.count('search_cache', result='hit' if recipe_dict is not None else 'miss')
+
+    recipe_index = ri.get_recipe_index()
+    if recipe_dict is None and recipe_index is not None:
+        with telemetry.span('recipe_index', op='lookup'):
+            recipe_dict = recipe_index.lookup(list(ingredients), cuisine_opt, engine_opt, limit_opt)
+        telemetry.count('recipe_index', result='hit' if recipe_dict is not None else 'miss')
+
+    if recipe_dict is not None:
+        st.session_state.recipe_results[query] = recipe_dict
     return recipe_dict
 
 
-@st.experimental_memo(suppress_st_warning=True)
-def process_recipes_to_df(recipe_dict, filter_opt):
+def store_recipes(query, recipe_dict):
+    # The job queue already wrote finished results to the persistent search cache, unless an engine failed
+    st.session_state.recipe_results[query] = recipe_dict
+
+
+@st.cache(allow_output_mutation=True)
+def load_scrape_job_queue():
+    return jobs.ScrapeJobQueue(max_workers=SCRAPE_WORKERS, max_pending=SCRAPE_MAX_PENDING)
+
 
-    df = pd.DataFrame(recipe_dict)
+def get_scrape_job(job_queue, query, retry=False):
+    # Reuse this session's job across reruns, the queue itself coalesces identical queries across sessions.
+    # A failed job is kept for a while so its error stays visible, pressing Scrape again submits a new one
+    job = job_queue.get(st.session_state.scrape_jobs.get(query, ''))
+    if job is None or (retry and job.status == jobs.FAILED):
+        job = job_queue.submit(query)
+        st.session_state.scrape_jobs[query] = job.id
+    return job
 
-    # Drop columns we won't be using
-    df = df.drop(['servings', 'ingredients'], axis=1, errors='ignore')
 
-    # Fill all NAs with 'None'
-    # df = df.fillna(np.nan).replace([np.nan], [None])
+@telemetry.timed('render', view='samples')
+def render_sample_recipes(placeholder, recipe_dict):
+    with placeholder.container():
+        st.subheader("Sample Recipes:")
+        n_samples = min(6, len(recipe_dict['image']))
+        grid = create_image_grid(n_samples, 3)
 
-    # Convert total_time hr min text to minutes
-    h = df['total_time'].str.extract('(\d+)\s+hr').astype(float).mul(60)
-    m = df['total_time'].str.extract('(\d+)\s+min').astype(float)
-    df['total_time'] = h.add(m, fill_value=0)
+        for idx in range(n_samples):
+            grid[idx].image(recipe_dict['image'][idx], caption=f"{recipe_dict['title'][idx]}")
 
-    # Extract only the digits from calories
-    if 'calories' in df.columns:
-        df['calories'] = df['calories'].str.extract('(^\d*)')
 
-    # Remove the 'reviews' text, and expand the thousands of reviews designated by k or K
-    df['reviews'] = df[df['reviews'].notnull()]['reviews'] \
-        .apply(lambda x: x.split()[0]) \
-        .replace({'K': '*1e3', 'k': '*1e3'}, regex=True) \
-        .map(pd.eval).astype(int)
+@telemetry.timed('parse')
+def build_recipes_df(recipe_dict, filter_opt):
 
-    # Convert all ratings to float type
-    df['ratings'] = df['ratings'].astype(float) / 1.0
+    df = frames.normalize_recipe_frame(recipe_dict)
 
     if filter_opt == 'Popularity':
         df = df.dropna(subset=['reviews']) \
@@ -134,7 +172,15 @@ def process_recipes_to_df(recipe_dict, filter_opt):
     return df
 
 
+# Only finished searches are memoized, partial results change on every poll and would pile up in the memo
+@st.experimental_memo(suppress_st_warning=True, max_entries=RECIPE_DF_MEMO_ENTRIES)
+def process_recipes_to_df(recipe_dict, filter_opt):
+    return build_recipes_df(recipe_dict, filter_opt)
+
+
 def build_and_configure_aggrid(df):
+    from st_aggrid import GridOptionsBuilder, JsCode
+
     gb = GridOptionsBuilder.from_dataframe(df)
     gb.configure_pagination(enabled=True)
     gb.configure_selection(selection_mode='disabled', use_checkbox=False)
@@ -149,6 +195,7 @@ def build_and_configure_aggrid(df):
     return grid_options
 
 
+@telemetry.timed('render', view='recipe')
 def print_recipe(recipe_item):
     if recipe_item.name:
         st.subheader(recipe_item.name)
@@ -169,10 +216,9 @@ def print_recipe(recipe_item):
 
 
 # NOTE: There is no entry point for a streamlit app, the entire script will re-run on any UI interaction
+@telemetry.timed('rerun')
 def main():
-    t = time.localtime()
-    current_time = time.strftime("%H:%M:%S", t)
-    print(f'---{current_time}: SCRIPT START ---')
+    telemetry.event('script_start')
 
     # Define initial session states
     if 'classify_btn_clicked' not in st.session_state:
@@ -184,6 +230,17 @@ def main():
     if 'results_btn_clicked' not in st.session_state:
         st.session_state.results_btn_clicked = False
 
+    if 'recipe_results' not in st.session_state:
+        st.session_state.recipe_results = {}
+
+    if 'scrape_jobs' not in st.session_state:
+        st.session_state.scrape_jobs = {}
+
+    pred_cache = pc.get_prediction_cache(MODEL_FILE, PRED_CACHE_DIR)
+    if 'upload_cache' not in st.session_state:
+        # Keys computed at decode time, so classifying never re-reads the uploaded bytes
+        st.session_state.upload_cache = uc.UploadCache(UPLOAD_BUDGET_BYTES, key_fn=pred_cache.key)
+
     # Define session state callbacks
     def classify_click_cb():
         st.session_state.classify_btn_clicked = True
@@ -194,15 +251,14 @@ def main():
     def results_click_cb():
         st.session_state.results_btn_clicked = True
 
-    with st.spinner('Loading model...'):
-        loaded_model = load_resnet_model()
+    poll_scrape_job = False
 
     pred_dict = {
         'filename': [],
         'prediction': [],
         'probability': []
     }
-    image_list = []
+    uploads = []
 
     # Disable warning
     st.set_option('deprecation.showfileUploaderEncoding', False)
@@ -219,27 +275,42 @@ def main():
                                              on_click=classify_click_cb)
 
     if uploaded_files:
-        grid = create_image_grid(len(uploaded_files), 3)
-
-        for idx, uploaded_file in enumerate(uploaded_files):
-            image = Image.open(uploaded_file)
-            image_list.append(image)
+        # Each upload is decoded once into a thumbnail and a model input, full resolution images are not kept
+        st.session_state.upload_cache.retain(uploaded_files)
+        uploads = st.session_state.upload_cache.get_many(uploaded_files)
+        grid = create_image_grid(len(uploads), 3)
 
-            grid[idx].image(image, caption=f'Image #{idx}:\n{uploaded_file.name}')
-            pred_dict['filename'].append(uploaded_file.name)
+        for idx, upload in enumerate(uploads):
+            grid[idx].image(upload.thumbnail, caption=f'Image #{idx}:\n{upload.name}')
+            pred_dict['filename'].append(upload.name)
 
     if classify_btn or st.session_state.classify_btn_clicked:
-        if not image_list:  # This will only be populated if images were uploaded
+        if not uploads:  # This will only be populated if images were uploaded
             st.sidebar.warning('Please upload image(s) first!')
         else:
-            for idx, single_image in enumerate(image_list):
-                cur_pred, cur_prob = mh.predict(single_image, loaded_model, class_names)
-                pred_dict['prediction'].append(cur_pred)
-                pred_dict['probability'].append(f'{cur_prob:.4f}')
+            # The model (and tensorflow with it) is only loaded once someone actually classifies images
+            with st.spinner('Loading model...'):
+                inference_server = load_inference_server()
+            loaded_model = mh.InferenceClient(inference_server)
+
+            telemetry.count('images_uploaded', len(uploads))
+            with telemetry.span('classify'):
+                keys = [upload.key for upload in uploads]
+                pixels = [upload.pixels for upload in uploads]
+                for cur_pred, cur_prob in mh.predict_pixels_cached(keys, pixels, loaded_model, class_names,
+                                                                   pred_cache):
+                    pred_dict['prediction'].append(cur_pred)
+                    pred_dict['probability'].append(f'{cur_prob:.4f}')
 
             st.subheader("Predictions:")
             pred_df = process_predictions_to_df(pred_dict)
             st.dataframe(pred_df, use_container_width=True)
+            cache_stats = pred_cache.stats()
+            upload_stats = st.session_state.upload_cache.stats()
+            st.caption(f"Prediction cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses. "
+                       f"Uploads: {upload_stats['items']} decoded, {upload_stats['bytes'] / 2**20:.1f} MB")
+            with st.sidebar.expander("Inference server stats:"):
+                st.json(inference_server.stats())
 
             #time.sleep(1)
             st.success('Image classification successful!')
@@ -251,9 +322,9 @@ def main():
 
         engine_option = st.radio(
             'Select search engine:',
-            options=('Google', 'Bing')
+            options=('Google', 'Bing', 'All')
         )
-        st.caption('Use Google for accuracy, Bing for more variety.')
+        st.caption('Use Google for accuracy, Bing for more variety, All to query both at once.')
 
         limit_option = st.select_slider(
             'Select max recipes to scrape:',
@@ -286,19 +357,53 @@ def main():
             st.sidebar.warning('Please classify image(s) first!')
             st.session_state.scrape_btn_clicked = False
         else:
-            recipe_dict = scrape_recipes(pred_dict, cuisine_option, engine_option, limit_option, ignore_option)
-            recipe_df = process_recipes_to_df(recipe_dict, filter_option)
-            # st.session_state.recipe_df = process_recipes_to_df(recipe_dict, filter_option)
-
-            # Display some images
-            st.subheader("Sample Recipes:")
-            grid2 = create_image_grid(6, 3)
+            query = build_scrape_query(pred_dict, cuisine_option, engine_option, limit_option, ignore_option)
+            recipe_dict = get_cached_recipes(query)
+            scrape_status = jobs.DONE
+
+            if recipe_dict is None:
+                # Scraping runs on the job queue's worker processes, this rerun only renders what has arrived so far
+                job_queue = load_scrape_job_queue()
+                try:
+                    job = get_scrape_job(job_queue, query, retry=scrape_btn)
+                except jobs.JobQueueFull:
+                    job = None
+                    st.warning('Too many searches are running right now, please try again shortly.')
+
+                snapshot = job_queue.snapshot(job.id) if job is not None else None
+                if snapshot is None:
+                    scrape_status = jobs.FAILED
+                    recipe_dict = recipe_search.ResultCollector(engine_option).results
+                else:
+                    scrape_status = snapshot['status']
+                    recipe_dict = snapshot['results']
+
+                if scrape_status == jobs.DONE:
+                    store_recipes(query, recipe_dict)
+                    if snapshot['failed_engines']:
+                        st.warning(f"{' and '.join(snapshot['failed_engines'])} search failed, "
+                                   f"showing results from the other engine only.")
+                elif scrape_status == jobs.FAILED:
+                    if snapshot is not None:
+                        st.error(f"Recipe scraping failed: {snapshot['error']}")
+                else:
+                    expected = (query[3] or 0) + (15 if engine_option != 'Bing' else 0)
+                    st.progress(min(len(recipe_dict['link']) / expected, 1.0))
+                    poll_scrape_job = True
 
-            for idx in range(6):
-                grid2[idx].image(recipe_dict['image'][idx], caption=f"{recipe_dict['title'][idx]}")
+            render_sample_recipes(st.empty(), recipe_dict)
+            if scrape_status == jobs.DONE:
+                recipe_df = process_recipes_to_df(recipe_dict, filter_option)
+            else:
+                recipe_df = build_recipes_df(recipe_dict, filter_option)
 
-            st.success('Recipe scraping successful!')
-            st.info('Please proceed to Step 3 to display complete results.')
+            if scrape_status == jobs.DONE:
+                st.success('Recipe scraping successful!')
+                st.info('Please proceed to Step 3 to display complete results.')
+            elif scrape_status != jobs.FAILED:
+                st.info(f"Scraping in the background, {len(recipe_dict['link'])} recipes so far...")
+                st.dataframe(frames.normalize_recipe_frame(recipe_dict).drop(columns=['link', 'image']),
+                             use_container_width=True)
 
     with st.sidebar.form(key='results_form'):
         st.subheader("Step 3: Display")
@@ -315,20 +420,11 @@ def main():
         else:
             # TODO: Do NOT pick something with number in title that we won't be able to parse json for
             if hungry_check:
-                # Display a random recipe on the page
-                recipe_filled = False
-
-                while not recipe_filled:
-                    row_idx = recipe_df.head(100).sample().index.tolist()[0]
-                    print(row_idx, recipe_df.loc[row_idx, 'title'])
-                    json_ld = scraper.get_recipe_json(recipe_df.loc[row_idx, 'link'])
-                    if not json_ld:
-                        continue
-                    recipe_item = parser.RecipeItem(json_ld)
-                    # TODO: This assumes at least one recipe will parse, fix to add max retries
-                    recipe_filled = recipe_item.fill_values()
-
-                if recipe_item.name:
+                # Display a random recipe on the page, racing a few candidates at once
+                with st.spinner('Picking a recipe...'):
+                    recipe_item = selector.select_recipe(recipe_df.head(100)['link'].dropna().tolist())
+
+                if recipe_item is not None and recipe_item.name:
                     with st.container():
                         st.subheader("Selected Recipe:")
                         print_recipe(recipe_item)
@@ -339,18 +435,26 @@ def main():
 
             else:
                 # Display the entire table of recipes
+                from st_aggrid import AgGrid, GridUpdateMode
+
                 st.subheader("Recipe Results:")
-                aggrid_options = build_and_configure_aggrid(recipe_df)
-                aggrid_table = AgGrid(recipe_df,
-                                      fit_columns_on_grid_load=True,
-                                      gridOptions=aggrid_options,
-                                      update_mode=GridUpdateMode.SELECTION_CHANGED,
-                                      allow_unsafe_jscode=True,
-                                      theme='streamlit')
+                with telemetry.span('render', view='table'):
+                    aggrid_options = build_and_configure_aggrid(recipe_df)
+                    aggrid_table = AgGrid(recipe_df,
+                                          fit_columns_on_grid_load=True,
+                                          gridOptions=aggrid_options,
+                                          update_mode=GridUpdateMode.SELECTION_CHANGED,
+                                          allow_unsafe_jscode=True,
+                                          theme='streamlit')
 
                 st.success('Done! Recipes produced successfully!')
                 # st.snow()
 
+    # Rerun until the background scrape finishes, so partial results keep coming in without user interaction
+    if poll_scrape_job:
+        time.sleep(SCRAPE_POLL_SECONDS)
+        st.experimental_rerun()
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,105 @@
+# Accuracy drift, latency and RSS report for the keras model vs converted tflite models
+# Held-out folder layout is <dir>/<class name>/<image>, same as the training data
+# Usage: python benchmarks/bench_backends.py --holdout-dir data/holdout \
+#            resnetv2_250_cls_92_acc.hdf5 resnetv2_250_cls_92_acc_float16.tflite resnetv2_250_cls_92_acc_int8.tflite
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+def list_holdout(holdout_dir):
+    paths, labels = [], []
+    for label in sorted(os.listdir(holdout_dir)):
+        class_dir = os.path.join(holdout_dir, label)
+        if not os.path.isdir(class_dir):
+            continue
+        for f in sorted(os.listdir(class_dir)):
+            if f.lower().endswith(('.jpg', '.jpeg', '.png')):
+                paths.append(os.path.join(class_dir, f))
+                labels.append(label)
+    return paths, labels
+
+
+def run_backend(model_file, classes_file, holdout_dir, batch_size):
+    # Runs in its own process so RSS reflects only this backend
+    import model_helper as mh
+
+    start = time.perf_counter()
+    model = mh.load_saved_model(model_file)
+    load_time = time.perf_counter() - start
+
+    classes = mh.get_classes(classes_file)
+    paths, labels = list_holdout(holdout_dir)
+
+    batches = list(mh.iter_preprocessed_batches(paths, batch_size=batch_size))
+    model.predict_on_batch(batches[0][:1])  # warm up
+
+    latencies, probs = [], []
+    for batch in batches:
+        start = time.perf_counter()
+        probs.append(np.asarray(model.predict_on_batch(batch)))
+        latencies.append((time.perf_counter() - start) / len(batch))
+    probs = np.concatenate(probs)
+
+    preds = [classes[int(i)] for i in probs.argmax(axis=1)]
+    return {
+        'model': model_file,
+        'load_time_s': load_time,
+        'accuracy': float(np.mean([p == y for p, y in zip(preds, labels)])),
+        'latency_ms_per_image_p50': float(np.percentile(latencies, 50) * 1e3),
+        'latency_ms_per_image_p95': float(np.percentile(latencies, 95) * 1e3),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'probs': probs.tolist(),
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('models', nargs='+')
+    arg_parser.add_argument('--holdout-dir', required=True)
+    arg_parser.add_argument('--classes', default='resnetv2_250_cls_92_acc.json')
+    arg_parser.add_argument('--batch-size', type=int, default=16)
+    arg_parser.add_argument('--out', default=None)
+    arg_parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_backend(args.models[0], args.classes, args.holdout_dir, args.batch_size)))
+        return
+
+    results = []
+    for model_file in args.models:
+        out = subprocess.run([sys.executable, __file__, model_file, '--worker',
+                              '--holdout-dir', args.holdout_dir, '--classes', args.classes,
+                              '--batch-size', str(args.batch_size)],
+                             check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    # Drift is measured against the first model given, normally the keras hdf5
+    reference = np.array(results[0].pop('probs'))
+    for result in results[1:]:
+        probs = np.array(result.pop('probs'))
+        result['top1_agreement'] = float(np.mean(probs.argmax(axis=1) == reference.argmax(axis=1)))
+        result['max_abs_prob_diff'] = float(np.abs(probs - reference).max())
+
+    print(f'{"model":<50} {"acc":>6} {"agree":>6} {"p50 ms":>8} {"p95 ms":>8} {"load s":>7} {"rss MB":>8}')
+    for r in results:
+        print(f'{os.path.basename(r["model"]):<50} {r["accuracy"]:6.3f} {r.get("top1_agreement", 1.0):6.3f} '
+              f'{r["latency_ms_per_image_p50"]:8.2f} {r["latency_ms_per_image_p95"]:8.2f} '
+              f'{r["load_time_s"]:7.2f} {r["peak_rss_mb"]:8.1f}')
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+# Before/after timings for per-element ('elements', the previous implementation) vs bulk execute_script card
+# extraction, for both engines, with the number of WebDriver commands each one sends (one HTTP round trip to
+# geckodriver per command, which is what the bulk path removes)
+# Needs firefox, plus network unless --replay points at recorded fixtures (see replay_server.py), e.g.
+#   python benchmarks/bench_extraction.py --limits 15 100 500 --replay fixtures/
+# --stub runs both extraction paths against an in-process fake page instead, no browser needed. Its command
+# counts are exact, its timings only cover the Python side and are not a stand-in for a real browser.
+#
+# Commands per extraction, from --stub (same code paths as a real driver, so the counts carry over):
+#   engine  limit  cards  elements  bulk
+#   google     15     15       241     1
+#   google    100    100      1601     1
+#   google    500    500      8001     1
+#   bing       15     15       151     1
+#   bing      100    100      1001     1
+#   bing      500    500      5001     1
+# Wall-clock timings need a firefox run with --replay, none was available when these counts were taken.
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import recipe_scraper as scraper
+import search_results as sr
+
+
+class CommandCounter:
+    """Counts WebDriver commands by wrapping driver.execute, which WebElement calls go through as well."""
+
+    def __init__(self, driver):
+        self.commands = 0
+        execute = driver.execute
+
+        def counting_execute(*args, **kwargs):
+            self.commands += 1
+            return execute(*args, **kwargs)
+
+        driver.execute = counting_execute
+
+
+class StubElement:
+    def __init__(self, driver, value: str):
+        self._driver = driver
+        self._value = value
+
+    def find_element(self, by, selector):
+        self._driver.execute('findChildElement')
+        return StubElement(self._driver, f'{self._value} {selector}')
+
+    @property
+    def text(self):
+        self._driver.execute('getElementText')
+        return self._value
+
+    def get_attribute(self, name):
+        self._driver.execute('getElementAttribute')
+        return f'https://example.com/{abs(hash((self._value, name)))}'
+
+
+class StubDriver:
+    """A page of n_cards result cards answering the same calls the extractors make, one command per call."""
+
+    def __init__(self, n_cards: int):
+        self.n_cards = n_cards
+
+    def execute(self, command):
+        return None
+
+    def find_elements(self, by, selector):
+        self.execute('findElements')
+        return [StubElement(self, f'card {i}') for i in range(self.n_cards)]
+
+    def execute_script(self, script, start=0, end=None):
+        self.execute('executeScript')
+        fields = ('title', 'link', 'image', 'source', 'total_time', 'ingredients', 'ratings', 'reviews') \
+            if script == scraper.GOOGLE_CARDS_JS else ('title', 'link', 'image', 'tags', 'rating_label')
+        return [{field: f'card {i} {field}' for field in fields} for i in range(self.n_cards)][start:end]
+
+
+def extract(driver, engine, extraction, limit):
+    if engine == 'google':
+        return scraper._extract_google_cards(driver, extraction)
+    return scraper._extract_bing_cards(driver, extraction, limit)
+
+
+def time_extraction(driver, counter, engine, extraction, limit, repeat):
+    timings = []
+    for _ in range(repeat):
+        counter.commands = 0
+        start = time.perf_counter()
+        cards = extract(driver, engine, extraction, limit)
+        timings.append(time.perf_counter() - start)
+    return min(timings), len(cards), counter.commands
+
+
+def run(driver, counter, engine, limit, repeat):
+    elements_time, n_cards, elements_commands = time_extraction(driver, counter, engine, 'elements', limit, repeat)
+    bulk_time, _, bulk_commands = time_extraction(driver, counter, engine, 'bulk', limit, repeat)
+    print(f'{engine:<7} {limit:>6} {n_cards:>6} {elements_commands:>9} {bulk_commands:>5} '
+          f'{elements_time:11.3f} {bulk_time:8.3f} {elements_time / bulk_time:7.1f}x')
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--ingredients', nargs='+', default=['carrot', 'potato'])
+    arg_parser.add_argument('--limits', type=int, nargs='+', default=[15, 100, 500])
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--replay', default=None, help='fixture directory to serve the search pages from')
+    arg_parser.add_argument('--stub', action='store_true', help='count commands against a fake page, no browser')
+    args = arg_parser.parse_args()
+
+    print(f'{"engine":<7} {"limit":>6} {"cards":>6} {"elements":>9} {"bulk":>5} '
+          f'{"elements s":>11} {"bulk s":>8} {"speedup":>8}')
+
+    if args.stub:
+        # Google has no limit, so each limit stands for a page that expanded to that many cards
+        for engine in ('google', 'bing'):
+            for limit in args.limits:
+                driver = StubDriver(limit)
+                run(driver, CommandCounter(driver), engine, limit, args.repeat)
+        return
+
+    server = None
+    if args.replay:
+        from replay_server import ReplayServer
+
+        server = ReplayServer(args.replay, grid_size=max(args.limits)).start()
+        sr.GOOGLE_SEARCH_URL = server.google_search_url
+        sr.BING_SEARCH_URL = server.bing_search_url
+
+    pool = scraper.WebDriverPool(size=1)
+    try:
+        with pool.driver() as driver:
+            counter = CommandCounter(driver)
+            # Load each page once, expanded as far as it goes, then time extraction only over the loaded page
+            for _ in scraper._iter_google(driver, args.ingredients, 'Any', extraction='bulk'):
+                pass
+            n_google = len(scraper._extract_google_cards(driver, 'bulk'))
+            run(driver, counter, 'google', n_google, args.repeat)
+
+            for _ in scraper._iter_bing(driver, args.ingredients, 'Any', max(args.limits), extraction='bulk'):
+                pass
+            for limit in args.limits:
+                run(driver, counter, 'bing', limit, args.repeat)
+    finally:
+        pool.close()
+        if server is not None:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+# Cold import time of the app's modules from `python -X importtime`, and which heavy dependencies each one pulls in
+# Usage: python benchmarks/bench_import_time.py --output import_time.json
+#        python benchmarks/bench_import_time.py --baseline benchmarks/import_time_baseline.json
+#        (non-zero exit on regression)
+#
+# import_time_baseline.json is the report right after the lazy import split, median of 5 runs on Python 3.11,
+# x86_64, selenium 4.5, bs4 4.15, pandas 3.0 (tensorflow not installed). Before -> after the split, in ms:
+#   model_helper      failed (imported tensorflow at load) -> 119
+#   recipe_selector   226 (selenium, webdriver_manager, bs4) -> 130 (none)
+#   recipe_search     223 (selenium, webdriver_manager, bs4) -> 6 (none)
+#   scrape_jobs       241 (selenium, webdriver_manager, bs4) -> 56 (none)
+#   http_scraper      146 (bs4) -> 156 (bs4)
+#   recipe_scraper    220 (selenium, webdriver_manager, bs4) -> 197 (selenium, webdriver_manager)
+# recipe_fetcher did not exist before the split, it imports in 112 ms without any heavy dependency.
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+MODULES = ['model_helper', 'recipe_fetcher', 'recipe_selector', 'recipe_search', 'scrape_jobs',
+           'http_scraper', 'recipe_scraper']
+HEAVY_PACKAGES = ['tensorflow', 'selenium', 'webdriver_manager', 'bs4', 'st_aggrid', 'streamlit']
+
+# Packages a module must not import at load time, these are what the lazy import split exists for
+MUST_NOT_IMPORT = {
+    'model_helper': ['tensorflow'],
+    'recipe_fetcher': ['selenium', 'webdriver_manager', 'bs4'],
+    'recipe_selector': ['selenium', 'webdriver_manager', 'bs4'],
+    'recipe_search': ['selenium', 'webdriver_manager', 'bs4'],
+    'scrape_jobs': ['selenium', 'webdriver_manager', 'bs4', 'streamlit'],
+}
+
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)$')
+
+
+def parse_importtime(stderr):
+    # Lines come children first, with nesting shown by indentation. Returns (name, cumulative us, parent name)
+    entries, pending = [], []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        _, cumulative, indent, name = match.groups()
+        depth = len(indent)
+        while pending and pending[-1][0] > depth:
+            _, child, child_cumulative = pending.pop()
+            entries.append((child, child_cumulative, name))
+        pending.append((depth, name, int(cumulative)))
+    entries.extend((name, cumulative, None) for _, name, cumulative in pending)
+    return entries
+
+
+def root(name):
+    return name.split('.')[0] if name else None
+
+
+def profile_import(module):
+    # Fresh interpreter per run, so nothing is already in sys.modules
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None
+
+    entries = parse_importtime(proc.stderr)
+
+    heavy_us = {}
+    for name, cumulative, parent in entries:
+        # Only count the outermost import of a package, its submodules are already in that cumulative time
+        if root(name) in HEAVY_PACKAGES and root(parent) != root(name):
+            heavy_us[root(name)] = heavy_us.get(root(name), 0) + cumulative
+
+    return {
+        'total_ms': sum(cumulative for name, cumulative, parent in entries if name == module) / 1e3,
+        'heavy_ms': {pkg: us / 1e3 for pkg, us in heavy_us.items()},
+        'imported': sorted(heavy_us),
+    }
+
+
+def run(modules, repeats):
+    report = {}
+    for module in modules:
+        runs = [profile_import(module) for _ in range(repeats)]
+        if any(r is None for r in runs):
+            report[module] = {'error': 'import failed'}
+            continue
+        report[module] = {
+            'total_ms': statistics.median(r['total_ms'] for r in runs),
+            'heavy_ms': runs[-1]['heavy_ms'],
+            'imported': runs[-1]['imported'],
+        }
+    return report
+
+
+def find_regressions(report, baseline, tolerance, min_delta_ms):
+    problems = []
+    for module, result in report.items():
+        if 'error' in result:
+            continue
+        for pkg in MUST_NOT_IMPORT.get(module, []):
+            if pkg in result['imported']:
+                problems.append(f'{module} imports {pkg} at load time')
+        before = (baseline or {}).get(module)
+        if not before or 'total_ms' not in before:
+            continue
+        # Both a relative and an absolute slowdown, a few ms on a module that imports in 5 ms is noise
+        slowdown = result['total_ms'] - before['total_ms']
+        if slowdown > before['total_ms'] * tolerance and slowdown > min_delta_ms:
+            problems.append(f"{module} import time {before['total_ms']:.1f} -> {result['total_ms']:.1f} ms")
+    return problems
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('modules', nargs='*', default=MODULES)
+    arg_parser.add_argument('--repeats', type=int, default=5)
+    arg_parser.add_argument('--output', help='write the report as JSON')
+    arg_parser.add_argument('--baseline', help='previous JSON report to compare against')
+    arg_parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='allowed relative slowdown vs the baseline before it counts as a regression')
+    arg_parser.add_argument('--min-delta-ms', type=float, default=10,
+                            help='slowdowns smaller than this never count, whatever the relative change')
+    args = arg_parser.parse_args()
+
+    report = run(args.modules, args.repeats)
+
+    print(f'{"module":<18} {"total ms":>9}  heavy dependencies imported')
+    for module, result in report.items():
+        if 'error' in result:
+            print(f'{module:<18} {"-":>9}  {result["error"]}')
+            continue
+        heavy = ', '.join(f'{pkg} ({ms:.0f} ms)' for pkg, ms in result['heavy_ms'].items()) or '-'
+        print(f'{module:<18} {result["total_ms"]:9.1f}  {heavy}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    problems = find_regressions(report, baseline, args.tolerance, args.min_delta_ms)
+    for problem in problems:
+        print(f'REGRESSION: {problem}')
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+# Latency percentiles, throughput vs batch size and thread count, load time and peak RSS per model backend
+# Runs against the real model files, or a randomly initialised ResNet50V2 with the same input/output shape when
+# they are not available (the hdf5 in the repo is a git-lfs pointer until `git lfs pull`)
+# Usage: python benchmarks/bench_inference.py --out inference.json
+#        python benchmarks/bench_inference.py resnetv2_250_cls_92_acc.hdf5 resnetv2_250_cls_92_acc_float16.tflite \
+#            --batch-sizes 1 8 32 --threads 1 2 4
+#        python benchmarks/bench_inference.py --synthetic
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+LFS_POINTER_PREFIX = b'version https://git-lfs'
+
+
+def is_usable_model(model_file):
+    if not os.path.isfile(model_file):
+        return False
+    with open(model_file, 'rb') as f:
+        return not f.read(len(LFS_POINTER_PREFIX)).startswith(LFS_POINTER_PREFIX)
+
+
+def build_synthetic_models(out_dir, n_classes):
+    # Same backbone, input size and head width as the trained classifier, so timings and memory are representative
+    import tensorflow as tf
+
+    import convert_model
+    import model_helper as mh
+
+    backbone = tf.keras.applications.ResNet50V2(weights=None, include_top=False, pooling='avg',
+                                                input_shape=(*mh.IMG_SIZE, 3))
+    outputs = tf.keras.layers.Dense(n_classes, activation='softmax')(backbone.output)
+    model = tf.keras.Model(backbone.input, outputs)
+
+    keras_file = os.path.join(out_dir, 'synthetic_resnetv2.hdf5')
+    model.save(keras_file)
+    tflite_file = os.path.join(out_dir, 'synthetic_resnetv2_float16.tflite')
+    convert_model.convert(keras_file, tflite_file, 'float16')
+
+    return [keras_file, tflite_file]
+
+
+def percentiles_ms(latencies):
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1e3
+    return {'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99)}
+
+
+def run_backend(model_file, num_threads, batch_sizes, iterations, seed=0):
+    # Runs in its own process so RSS and the thread setting only reflect this backend
+    import model_helper as mh
+
+    start = time.perf_counter()
+    model = mh.load_saved_model(model_file, num_threads=num_threads)
+    load_time = time.perf_counter() - start
+
+    rng = np.random.default_rng(seed)
+    results = []
+    for batch_size in batch_sizes:
+        x = rng.uniform(-1, 1, (batch_size, *mh.IMG_SIZE, 3)).astype(np.float32)
+        model.predict_on_batch(x)  # warm up, first call also traces/allocates for this batch shape
+
+        latencies = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            np.asarray(model.predict_on_batch(x))
+            latencies.append(time.perf_counter() - start)
+
+        results.append({
+            'batch_size': batch_size,
+            'images_per_s': batch_size * iterations / sum(latencies),
+            **percentiles_ms(latencies),
+        })
+
+    return {
+        'model': model_file,
+        'backend': 'tflite' if model_file.endswith('.tflite') else 'keras',
+        'threads': num_threads,
+        'load_time_s': load_time,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'batches': results,
+    }
+
+
+def run_worker(model_file, num_threads, batch_sizes, iterations):
+    cmd = [sys.executable, __file__, model_file, '--worker', '--iterations', str(iterations),
+           '--threads', str(num_threads or 0), '--batch-sizes', *map(str, batch_sizes)]
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('models', nargs='*', default=['resnetv2_250_cls_92_acc.hdf5'])
+    arg_parser.add_argument('--classes', default='resnetv2_250_cls_92_acc.json')
+    arg_parser.add_argument('--synthetic', action='store_true', help='always use the synthetic stand-in models')
+    arg_parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 16, 32])
+    arg_parser.add_argument('--threads', type=int, nargs='+', default=[0],
+                            help='intra-op / interpreter threads to try, 0 leaves the backend default')
+    arg_parser.add_argument('--iterations', type=int, default=20)
+    arg_parser.add_argument('--out', default=None)
+    arg_parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.worker:
+        result = run_backend(args.models[0], args.threads[0] or None, args.batch_sizes, args.iterations)
+        print(json.dumps(result))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        models = [m for m in args.models if is_usable_model(m)] if not args.synthetic else []
+        synthetic = not models
+        if synthetic:
+            print('Model files not available, benchmarking a synthetic ResNet50V2 stand-in', file=sys.stderr)
+            import model_helper as mh
+            models = build_synthetic_models(tmp_dir, len(mh.get_classes(args.classes)))
+
+        runs = [run_worker(model_file, threads, args.batch_sizes, args.iterations)
+                for model_file in models for threads in args.threads]
+
+    print(f'{"model":<42} {"thr":>3} {"load s":>7} {"rss MB":>8} {"batch":>5} '
+          f'{"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"img/s":>8}')
+    for r in runs:
+        for b in r['batches']:
+            print(f'{os.path.basename(r["model"]):<42} {r["threads"] or "-":>3} {r["load_time_s"]:7.2f} '
+                  f'{r["peak_rss_mb"]:8.1f} {b["batch_size"]:>5} {b["p50_ms"]:8.2f} {b["p95_ms"]:8.2f} '
+                  f'{b["p99_ms"]:8.2f} {b["images_per_s"]:8.1f}')
+
+    if args.out:
+        report = {
+            'synthetic': synthetic,
+            'iterations': args.iterations,
+            'machine': {'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+                        'python': platform.python_version()},
+            'runs': runs,
+        }
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
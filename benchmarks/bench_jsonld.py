@@ -0,0 +1,50 @@
+# Parse time and peak memory of the byte-scanning JSON-LD extractor vs the full BeautifulSoup parse
+# Usage: python benchmarks/bench_jsonld.py path/to/saved/recipe/pages
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import jsonld
+import recipe_fetcher as fetcher
+
+
+def load_corpus(pages_dir):
+    pages = []
+    for f in sorted(os.listdir(pages_dir)):
+        if f.lower().endswith(('.html', '.htm')):
+            with open(os.path.join(pages_dir, f), 'rb') as fp:
+                pages.append(fp.read())
+    return pages
+
+
+def measure(fn, pages):
+    tracemalloc.start()
+    start = time.perf_counter()
+    results = [fn(page) for page in pages]
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    found = sum(jsonld.find_recipe_node(r) is not None for r in results if r is not None)
+    return elapsed, peak, found
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('pages_dir')
+    args = arg_parser.parse_args()
+
+    pages = load_corpus(args.pages_dir)
+    total_mb = sum(map(len, pages)) / 1e6
+    print(f'{len(pages)} pages, {total_mb:.1f} MB')
+
+    print(f'{"extractor":<12} {"total s":>8} {"ms/page":>8} {"peak MB":>8} {"recipes":>8}')
+    for name, fn in [('soup', fetcher.parse_recipe_json_soup), ('bytes-scan', jsonld.extract_recipe_jsonld)]:
+        elapsed, peak, found = measure(fn, pages)
+        print(f'{name:<12} {elapsed:8.3f} {elapsed / len(pages) * 1e3:8.2f} {peak / 1e6:8.1f} {found:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# Throughput comparison of per-image predict() vs predict_batch()
+# Usage: python benchmarks/bench_predict.py [--model resnetv2_250_cls_92_acc.hdf5] [--n-images 30]
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import model_helper as mh
+
+
+def make_images(n, size=(640, 480), seed=0):
+    rng = np.random.default_rng(seed)
+    return [Image.fromarray(rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)) for _ in range(n)]
+
+
+def encode_jpegs(images):
+    files = []
+    for img in images:
+        buf = io.BytesIO()
+        img.save(buf, format='JPEG')
+        files.append(buf)
+    return files
+
+
+def time_per_image(images, model, classes):
+    start = time.perf_counter()
+    results = [mh.predict(img, model, classes) for img in images]
+    return time.perf_counter() - start, results
+
+
+def time_batch(images, model, classes, batch_size):
+    start = time.perf_counter()
+    results = mh.predict_batch(images, model, classes, batch_size=batch_size)
+    return time.perf_counter() - start, results
+
+
+def time_stream(files, model, classes, batch_size):
+    start = time.perf_counter()
+    results = list(mh.predict_stream(files, model, classes, batch_size=batch_size))
+    return time.perf_counter() - start, results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--model', default='resnetv2_250_cls_92_acc.hdf5')
+    arg_parser.add_argument('--classes', default='resnetv2_250_cls_92_acc.json')
+    arg_parser.add_argument('--n-images', type=int, default=30)
+    arg_parser.add_argument('--batch-sizes', type=int, nargs='+', default=[8, 16, 32])
+    args = arg_parser.parse_args()
+
+    model = mh.load_saved_model(args.model)
+    classes = mh.get_classes(args.classes)
+    images = make_images(args.n_images)
+
+    # Warm up so graph tracing is not billed to either path
+    mh.predict(images[0], model, classes)
+    mh.predict_batch(images[:2], model, classes)
+
+    elapsed, single_results = time_per_image(images, model, classes)
+    print(f'per-image     : {elapsed:8.3f}s  {len(images) / elapsed:8.2f} img/s')
+
+    for batch_size in args.batch_sizes:
+        elapsed, batch_results = time_batch(images, model, classes, batch_size)
+        mismatches = sum(a[0] != b[0] for a, b in zip(single_results, batch_results))
+        print(f'batch ({batch_size:>3})   : {elapsed:8.3f}s  {len(images) / elapsed:8.2f} img/s  '
+              f'mismatches={mismatches}')
+
+    # Streaming path includes JPEG decode + resize, so compare against decoding serially first
+    files = encode_jpegs(images)
+    start = time.perf_counter()
+    decoded = [Image.open(f) for f in files]
+    mh.predict_batch(decoded, model, classes)
+    elapsed = time.perf_counter() - start
+    print(f'decode+batch  : {elapsed:8.3f}s  {len(images) / elapsed:8.2f} img/s')
+
+    for batch_size in args.batch_sizes:
+        elapsed, _ = time_stream(files, model, classes, batch_size)
+        print(f'stream ({batch_size:>3})  : {elapsed:8.3f}s  {len(images) / elapsed:8.2f} img/s')
+
+
+if __name__ == '__main__':
+    main()
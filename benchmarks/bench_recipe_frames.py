@@ -0,0 +1,116 @@
+# Row-wise (previous app.py implementation) vs vectorized result post-processing at 500 and 50k rows
+# Usage: python benchmarks/bench_recipe_frames.py [--rows 500 50000]
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import recipe_frames as frames
+
+
+def legacy_recipes(recipe_dict):
+    df = pd.DataFrame(recipe_dict)
+    df = df.drop(['servings', 'ingredients'], axis=1, errors='ignore')
+    h = df['total_time'].str.extract(r'(\d+)\s+hr').astype(float).mul(60)
+    m = df['total_time'].str.extract(r'(\d+)\s+min').astype(float)
+    df['total_time'] = h.add(m, fill_value=0)
+    if 'calories' in df.columns:
+        df['calories'] = df['calories'].str.extract(r'(^\d*)')
+    df['reviews'] = df[df['reviews'].notnull()]['reviews'] \
+        .apply(lambda x: x.split()[0]) \
+        .replace({'K': '*1e3', 'k': '*1e3'}, regex=True) \
+        .map(pd.eval).astype(int)
+    df['ratings'] = df['ratings'].astype(float) / 1.0
+    return df
+
+
+def legacy_predictions(pred_dict):
+    def calc_confidence(row):
+        if row['probability'] < 0.33:
+            return 'Low'
+        elif 0.33 <= row['probability'] <= 0.66:
+            return 'Medium'
+        else:
+            return 'High'
+
+    df = pd.DataFrame(pred_dict)
+    df['probability'] = df['probability'].astype(float)
+    df['confidence'] = df.apply(calc_confidence, axis=1)
+    return df
+
+
+def make_recipes(n, seed=0):
+    rng = np.random.default_rng(seed)
+    hours = rng.integers(0, 3, n)
+    minutes = rng.integers(1, 60, n)
+    reviews = rng.integers(1, 5000, n)
+    return {
+        'title': [f'recipe {i}' for i in range(n)],
+        'link': [f'https://example.com/{i}' for i in range(n)],
+        'image': [f'https://example.com/{i}.jpg' for i in range(n)],
+        'source': rng.choice(['allrecipes.com', 'food.com', 'bbcgoodfood.com'], n).tolist(),
+        # Every tenth row is a range, which both parsers read as its upper bound
+        'total_time': [f'{m}-{m + 5} min' if i % 10 == 0 else f'{h} hr {m} min' if h else f'{m} min'
+                       for i, (h, m) in enumerate(zip(hours, minutes))],
+        'calories': [f'{c} cals' for c in rng.integers(50, 900, n)],
+        'servings': ['4 servs'] * n,
+        'ratings': [f'{r:.1f}' for r in rng.uniform(1, 5, n)],
+        'reviews': [f'{r / 1000:.1f}K reviews' if r >= 1000 else f'{r} reviews' for r in reviews],
+    }
+
+
+def make_predictions(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        'filename': [f'{i}.jpg' for i in range(n)],
+        'prediction': ['apple'] * n,
+        'probability': [f'{p:.4f}' for p in rng.uniform(0, 1, n)],
+    }
+
+
+def check_total_time_agreement():
+    samples = ['1 hr 20 min', '45 min', '10-15 min', '1-2 hrs', '1 hr 10-15 min', '2 hrs', 'Ready in 5 to 10 min',
+               '1 to 2 hrs 30 min', 'quick', None]
+    recipes = make_recipes(len(samples))
+    recipes['total_time'] = samples
+    legacy = legacy_recipes(recipes)['total_time'].to_numpy(dtype=float)
+    vectorized = frames.normalize_recipe_frame(recipes)['total_time'].to_numpy(dtype=float)
+    np.testing.assert_allclose(vectorized, legacy, err_msg='vectorized and row-wise total_time disagree')
+
+
+def best_of(fn, arg, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--rows', type=int, nargs='+', default=[500, 50000])
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    check_total_time_agreement()
+
+    print(f'{"stage":<12} {"rows":>7} {"row-wise s":>11} {"vectorized s":>13} {"speedup":>8} {"mem KB":>14}')
+    for n in args.rows:
+        recipes, preds = make_recipes(n), make_predictions(n)
+        for stage, legacy, vectorized, data in [('recipes', legacy_recipes, frames.normalize_recipe_frame, recipes),
+                                                ('predictions', legacy_predictions, frames.predictions_frame, preds)]:
+            legacy_time = best_of(legacy, data, args.repeat)
+            vectorized_time = best_of(vectorized, data, args.repeat)
+            legacy_mem = legacy(data).memory_usage(deep=True).sum() / 1e3
+            vectorized_mem = vectorized(data).memory_usage(deep=True).sum() / 1e3
+            print(f'{stage:<12} {n:>7} {legacy_time:11.4f} {vectorized_time:13.4f} '
+                  f'{legacy_time / vectorized_time:7.1f}x {legacy_mem:>6.0f}->{vectorized_mem:<6.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# Microbenchmark of the JSON-LD recipe normalizer, per document and in columnar batch mode
+# Corpus is a folder of saved recipe pages (.html) and/or extracted JSON-LD documents (.json)
+# Usage: python benchmarks/bench_recipe_parser.py path/to/corpus [--repeat 20]
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import jsonld
+import recipe_parser as parser
+
+
+def load_corpus(corpus_dir):
+    docs = []
+    for f in sorted(os.listdir(corpus_dir)):
+        path = os.path.join(corpus_dir, f)
+        if f.endswith('.json'):
+            with open(path, 'rb') as fp:
+                docs.append(json.load(fp))
+        elif f.endswith(('.html', '.htm')):
+            with open(path, 'rb') as fp:
+                docs.append(jsonld.extract_recipe_jsonld(fp.read()))
+    return [d for d in docs if d is not None]
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('corpus_dir')
+    arg_parser.add_argument('--repeat', type=int, default=20)
+    args = arg_parser.parse_args()
+
+    docs = load_corpus(args.corpus_dir)
+    complete = sum(parser.parse_many(docs)['complete'])
+    print(f'{len(docs)} documents, {complete} complete recipes')
+
+    def fill_items():
+        for doc in docs:
+            parser.RecipeItem(doc).fill_values()
+
+    for name, fn in [('RecipeItem.fill_values', fill_items),
+                     ('normalize_recipe', lambda: [parser.normalize_recipe(d) for d in docs]),
+                     ('parse_many', lambda: parser.parse_many(docs))]:
+        elapsed = best_of(fn, args.repeat)
+        print(f'{name:<24} {elapsed * 1e3:8.2f} ms  {elapsed / len(docs) * 1e6:8.1f} us/doc')
+
+
+if __name__ == '__main__':
+    main()
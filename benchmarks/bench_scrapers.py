@@ -0,0 +1,135 @@
+# End-to-end scrape latency, extraction time per card, scroll iterations and recipe fetch throughput, all served
+# from recorded fixtures (see replay_server.py) so runs are reproducible and need no network
+# Usage: python benchmarks/bench_scrapers.py fixtures/ --out scrapers.json
+#        python benchmarks/bench_scrapers.py fixtures/ --browser --limits 35 100 500   (needs firefox)
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+# Recipe pages must come from the fixtures every run, not from the on-disk recipe cache
+os.environ['PRODUCERECIPE_RECIPE_CACHE'] = ''
+
+from replay_server import ReplayServer
+import http_scraper
+import recipe_fetcher as fetcher
+import search_results as sr
+
+
+def timed(fn, repeat):
+    timings, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def bench_http(ingredients, cuisine, limits, repeat):
+    results = []
+    google_s, google = timed(lambda: http_scraper.scrape_recipes_google(ingredients, cuisine), repeat)
+    results.append({'engine': 'google', 'path': 'http', 'limit': None, 'seconds': google_s,
+                    'cards': len(google['link'])})
+
+    # Parse time on its own, so extraction cost per card is not hidden behind the request
+    url = sr.bing_search_url(ingredients, cuisine)
+    html = http_scraper.get_session().get(url, timeout=http_scraper.REQUEST_TIMEOUT).text
+    for limit in limits:
+        bing_s, bing = timed(lambda: http_scraper.scrape_recipes_bing(ingredients, cuisine, limit), repeat)
+        parse_s, cards = timed(lambda: http_scraper.parse_bing_html(html, limit, base_url=url), repeat)
+        results.append({'engine': 'bing', 'path': 'http', 'limit': limit, 'seconds': bing_s,
+                        'cards': len(bing['link']), 'ms_per_card': parse_s / max(len(cards), 1) * 1e3})
+    return results
+
+
+def bench_browser(ingredients, cuisine, limits, repeat):
+    import recipe_scraper as scraper
+    from wait_policy import WaitPolicy
+
+    results = []
+    pool = scraper.WebDriverPool(size=1)
+    try:
+        with pool.driver() as driver:
+            for extraction in scraper.EXTRACTION_MODES:
+                policy = WaitPolicy()
+                start = time.perf_counter()
+                n_cards = sum(len(batch['link']) for batch in
+                              scraper._iter_google(driver, ingredients, cuisine, extraction, policy))
+                results.append({'engine': 'google', 'path': 'browser', 'extraction': extraction, 'limit': None,
+                                'seconds': time.perf_counter() - start, 'cards': n_cards,
+                                'wait_seconds': policy.total_seconds()})
+
+            for limit in limits:
+                for extraction in scraper.EXTRACTION_MODES:
+                    policy = WaitPolicy()
+                    start = time.perf_counter()
+                    n_cards = sum(len(batch['link']) for batch in
+                                  scraper._iter_bing(driver, ingredients, cuisine, limit, extraction, policy))
+                    elapsed = time.perf_counter() - start
+
+                    # Re-extract from the fully loaded grid to get the pure extraction cost per card
+                    extract_s, cards = timed(lambda: scraper._extract_bing_cards(driver, extraction, limit), repeat)
+                    results.append({
+                        'engine': 'bing', 'path': 'browser', 'extraction': extraction, 'limit': limit,
+                        'seconds': elapsed, 'cards': n_cards,
+                        'ms_per_card': extract_s / max(len(cards), 1) * 1e3,
+                        'scroll_iterations': sum(t['step'] == 'scroll' for t in policy.timings),
+                        'wait_seconds': policy.total_seconds(),
+                    })
+    finally:
+        pool.close()
+    return results
+
+
+def bench_recipes(server, concurrency, repeat):
+    urls = server.fixtures.recipe_urls(server.origin)
+
+    def fetch_all():
+        return [json_ld for _, json_ld in fetcher.get_recipe_jsons(urls, concurrency=concurrency)]
+
+    elapsed, parsed = timed(fetch_all, repeat)
+    return {'pages': len(urls), 'parsed': sum(p is not None for p in parsed), 'seconds': elapsed,
+            'pages_per_s': len(urls) / elapsed if elapsed else None}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('fixture_dir')
+    arg_parser.add_argument('--ingredients', nargs='+', default=['carrot', 'potato'])
+    arg_parser.add_argument('--cuisine', default='Any')
+    arg_parser.add_argument('--limits', type=int, nargs='+', default=[35, 100, 500])
+    arg_parser.add_argument('--browser', action='store_true', help='also run the selenium engines')
+    arg_parser.add_argument('--grid-delay-ms', type=float, default=200,
+                            help='simulated latency of each lazily loaded Bing grid page')
+    arg_parser.add_argument('--concurrency', type=int, default=16)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--out', default=None)
+    args = arg_parser.parse_args()
+
+    with ReplayServer(args.fixture_dir, grid_size=max(args.limits), grid_delay=args.grid_delay_ms / 1e3) as server:
+        sr.GOOGLE_SEARCH_URL = server.google_search_url
+        sr.BING_SEARCH_URL = server.bing_search_url
+
+        scrapes = bench_http(args.ingredients, args.cuisine, args.limits, args.repeat)
+        if args.browser:
+            scrapes += bench_browser(args.ingredients, args.cuisine, args.limits, args.repeat)
+        recipes = bench_recipes(server, args.concurrency, args.repeat)
+
+    print(f'{"engine":<7} {"path":<8} {"extract":<9} {"limit":>5} {"cards":>6} {"total s":>8} '
+          f'{"ms/card":>8} {"scrolls":>7}')
+    for r in scrapes:
+        ms_per_card = f'{r["ms_per_card"]:8.3f}' if 'ms_per_card' in r else f'{"-":>8}'
+        print(f'{r["engine"]:<7} {r["path"]:<8} {r.get("extraction", "-"):<9} {r["limit"] or "-":>5} '
+              f'{r["cards"]:>6} {r["seconds"]:8.3f} {ms_per_card} {r.get("scroll_iterations", "-"):>7}')
+    print(f'recipes: {recipes["parsed"]}/{recipes["pages"]} parsed in {recipes["seconds"]:.3f}s')
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'scrapes': scrapes, 'recipes': recipes}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+# Record/replay fixtures for the scrapers: capture search result and recipe pages once, then serve them from a
+# local HTTP server so every scraper change can be measured without touching the network
+# Record: python benchmarks/replay_server.py record fixtures/ --ingredients carrot potato
+# Serve:  python benchmarks/replay_server.py serve fixtures/ --port 8765
+#         PRODUCERECIPE_GOOGLE_SEARCH_URL=http://127.0.0.1:8765/google/search \
+#         PRODUCERECIPE_BING_SEARCH_URL=http://127.0.0.1:8765/bing/search streamlit run app.py
+#
+# Bing search pages are not replayed verbatim: the recorded cards are served as a lazily loading grid
+# (first page server-rendered, the rest fetched on scroll after "See more") so the selenium scroll loop has
+# something to scroll through. Recipe links in every recorded page are rewritten to point at this server.
+import argparse
+import hashlib
+import html
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlencode, urljoin, urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+MANIFEST = 'manifest.json'
+ORIGIN_PLACEHOLDER = '{{REPLAY_ORIGIN}}'
+
+# 1x1 transparent gif, stands in for every card image so the browser never leaves localhost
+PIXEL_GIF = bytes.fromhex('47494638396101000100800000000000ffffff21f90401000000002c00000000010001000002024401003b')
+
+BING_GRID_JS = """
+const grid = document.getElementById('grid');
+let offset = grid.children.length, expanded = false, loading = false, exhausted = false;
+
+async function loadMore() {
+    if (!expanded || loading || exhausted) return;
+    loading = true;
+    const resp = await fetch(`/bing/grid?q=${encodeURIComponent(QUERY)}&offset=${offset}`);
+    const fragment = await resp.text();
+    if (fragment.trim()) {
+        grid.insertAdjacentHTML('beforeend', fragment);
+        offset = grid.children.length;
+    } else {
+        exhausted = true;
+    }
+    loading = false;
+}
+
+document.getElementById('see_more').addEventListener('click', e => {
+    e.preventDefault();
+    expanded = true;
+    e.target.style.display = 'none';
+    loadMore();
+});
+window.addEventListener('scroll', () => {
+    if (window.innerHeight + window.scrollY >= document.body.scrollHeight - 200) loadMore();
+});
+"""
+
+
+def query_key(url: str) -> str:
+    return parse_qs(urlsplit(url).query).get('q', [''])[0]
+
+
+def recipe_id(url: str) -> str:
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+
+
+def _esc(value: Optional[str]) -> str:
+    return html.escape(value or '', quote=True)
+
+
+def render_bing_card(card: dict, link: str) -> str:
+    return (f'<div class="wfrGridCell" role="button">'
+            f'<div class="b_responsiveWaterfallItemCard" data-prmurl="{_esc(link)}">'
+            f'<div class="rwimage"><img src="/static/pixel.gif"></div>'
+            f'<div class="rwtitle">{_esc(card["title"])}</div>'
+            f'<div class="rwtags">{_esc(card["tags"])}'
+            f'<span class="csrc" aria-label="{_esc(card["rating_label"])}"></span></div>'
+            f'</div></div>')
+
+
+class Fixtures:
+    """Recorded pages on disk: a manifest of search queries per engine, plus the recipe pages they link to."""
+
+    def __init__(self, fixture_dir: str):
+        self.fixture_dir = fixture_dir
+        path = os.path.join(fixture_dir, MANIFEST)
+        if os.path.exists(path):
+            with open(path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'google': {}, 'bing': {}, 'recipes': {}}
+
+    def save(self):
+        with open(os.path.join(self.fixture_dir, MANIFEST), 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+
+    def read(self, name: str) -> bytes:
+        with open(os.path.join(self.fixture_dir, name), 'rb') as f:
+            return f.read()
+
+    def write(self, name: str, content: bytes):
+        path = os.path.join(self.fixture_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def recipe_urls(self, origin: str) -> list:
+        return [f'{origin}/recipes/{rid}.html' for rid in self.manifest['recipes']]
+
+
+def record(fixture_dir: str, ingredients: list, cuisine: str, max_recipes: int = 40, browser: bool = False):
+    # Imported here so serving fixtures only needs the standard library
+    from bs4 import BeautifulSoup
+
+    import http_scraper
+    import recipe_fetcher as fetcher
+    import search_results as sr
+
+    fixtures = Fixtures(fixture_dir)
+    session = http_scraper.get_session()
+    pages = {}
+
+    for engine, url in [('google', sr.google_search_url(ingredients, cuisine)),
+                        ('bing', sr.bing_search_url(ingredients, cuisine))]:
+        if browser:
+            # The rendered DOM, for when the engine serves different markup to clients without javascript
+            import recipe_scraper as scraper
+            from wait_policy import WaitPolicy
+            with scraper.get_webdriver_pool().driver() as driver:
+                driver.get(url)
+                WaitPolicy().until_network_idle(driver)
+                pages[engine] = (url, driver.page_source)
+        else:
+            req = session.get(url, timeout=http_scraper.REQUEST_TIMEOUT)
+            req.raise_for_status()
+            pages[engine] = (url, req.text)
+
+    # Card link elements per engine, and how to read a resolved recipe URL off them
+    link_selectors = {
+        'google': ('.YwonT .v1uiFd a', 'href'),
+        'bing': ('.wfrGridCell .b_responsiveWaterfallItemCard', 'data-prmurl'),
+    }
+    soups, links = {}, []
+    for engine, (url, page) in pages.items():
+        soups[engine] = BeautifulSoup(page, http_scraper.HTML_PARSER)
+        selector, attr = link_selectors[engine]
+        for el in soups[engine].select(selector):
+            if el.has_attr(attr):
+                links.append(urljoin(url, el[attr]))
+    links = list(dict.fromkeys(links))[:max_recipes]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        recipe_pages = dict(zip(links, executor.map(lambda link: fetcher.fetch_recipe_html(link, session), links)))
+
+    replayed = {}
+    for link, content in recipe_pages.items():
+        if content is None:
+            continue
+        rid = recipe_id(link)
+        fixtures.write(f'recipes/{rid}.html', content)
+        fixtures.manifest['recipes'][rid] = {'url': link}
+        replayed[link] = f'{ORIGIN_PLACEHOLDER}/recipes/{rid}.html'
+
+    for engine, (url, _) in pages.items():
+        selector, attr = link_selectors[engine]
+        for el in soups[engine].select(selector):
+            if el.has_attr(attr) and urljoin(url, el[attr]) in replayed:
+                el[attr] = replayed[urljoin(url, el[attr])]
+
+        key = query_key(url)
+        name = f'{engine}/{hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]}.html'
+        fixtures.write(name, str(soups[engine]).encode('utf-8'))
+        entry = {'file': name, 'url': url}
+        if engine == 'bing':
+            entry['cards'] = http_scraper.parse_bing_html(str(soups[engine]), None, base_url=url)
+        fixtures.manifest[engine][key] = entry
+
+    fixtures.save()
+    return fixtures
+
+
+class ReplayServer:
+    """Serves recorded fixtures on localhost; start() returns once the server is accepting connections."""
+
+    def __init__(self, fixture_dir: str, host: str = '127.0.0.1', port: int = 0,
+                 page_size: int = 35, grid_size: int = 500, grid_delay: float = 0.2):
+        self.fixtures = Fixtures(fixture_dir)
+        self.page_size = page_size
+        self.grid_size = grid_size
+        self.grid_delay = grid_delay
+        self.requests_served = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def origin(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def google_search_url(self) -> str:
+        return f'{self.origin}/google/search'
+
+    @property
+    def bing_search_url(self) -> str:
+        return f'{self.origin}/bing/search'
+
+    def start(self) -> 'ReplayServer':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        if self._thread is not None:
+            self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _bing_cards(self, key: str, offset: int, count: int) -> Optional[str]:
+        entry = self.fixtures.manifest['bing'].get(key)
+        if entry is None:
+            return None
+        # Only cards whose recipe page was recorded, anything else would send the fetcher to the live site
+        cards = [card for card in entry['cards'] if card['link'] and card['link'].startswith(ORIGIN_PLACEHOLDER)]
+        if not cards:
+            return ''
+
+        rendered = []
+        for idx in range(offset, min(offset + count, self.grid_size)):
+            card = cards[idx % len(cards)]
+            link = card['link'].replace(ORIGIN_PLACEHOLDER, self.origin)
+            if idx >= len(cards):
+                # Repeats of the recorded cards need distinct links, or the result merger drops them as duplicates
+                link += ('&' if '?' in link else '?') + urlencode({'n': idx})
+            rendered.append(render_bing_card(card, link))
+        return ''.join(rendered)
+
+    def _bing_page(self, key: str) -> Optional[str]:
+        first_page = self._bing_cards(key, 0, self.page_size)
+        if first_page is None:
+            return None
+        # Fixed card height so the first page always overflows the viewport and the scroll loop has to scroll
+        return (f'<!DOCTYPE html><html><head><title>{html.escape(key)}</title>'
+                f'<style>.wfrGridCell {{ height: 240px; }}</style></head><body>'
+                f'<div id="grid">{first_page}</div>'
+                f'<a id="see_more" href="#" title="See more" role="button">See more</a>'
+                f'<script>const QUERY = {json.dumps(key)};{BING_GRID_JS}</script>'
+                f'</body></html>')
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, content_type: str = 'text/html; charset=utf-8'):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                server.requests_served += 1
+                parts = urlsplit(self.path)
+                params = parse_qs(parts.query)
+                key = params.get('q', [''])[0]
+                body, content_type = None, 'text/html; charset=utf-8'
+
+                if parts.path == '/google/search':
+                    entry = server.fixtures.manifest['google'].get(key)
+                    if entry is not None:
+                        page = server.fixtures.read(entry['file']).decode('utf-8')
+                        body = page.replace(ORIGIN_PLACEHOLDER, server.origin)
+                elif parts.path == '/bing/search':
+                    body = server._bing_page(key)
+                elif parts.path == '/bing/grid':
+                    time.sleep(server.grid_delay)
+                    body = server._bing_cards(key, int(params.get('offset', ['0'])[0]), server.page_size)
+                elif parts.path.startswith('/recipes/'):
+                    rid = os.path.splitext(os.path.basename(parts.path))[0]
+                    if rid in server.fixtures.manifest['recipes']:
+                        body = server.fixtures.read(f'recipes/{rid}.html')
+                elif parts.path == '/static/pixel.gif':
+                    body, content_type = PIXEL_GIF, 'image/gif'
+
+                if body is None:
+                    self._send(404, b'not recorded')
+                else:
+                    self._send(200, body.encode('utf-8') if isinstance(body, str) else body, content_type)
+
+        return Handler
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser('record')
+    record_parser.add_argument('fixture_dir')
+    record_parser.add_argument('--ingredients', nargs='+', default=['carrot', 'potato'])
+    record_parser.add_argument('--cuisine', default='Any')
+    record_parser.add_argument('--max-recipes', type=int, default=40)
+    record_parser.add_argument('--browser', action='store_true', help='capture the rendered DOM with selenium')
+
+    serve_parser = subparsers.add_parser('serve')
+    serve_parser.add_argument('fixture_dir')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    serve_parser.add_argument('--grid-size', type=int, default=500)
+    serve_parser.add_argument('--grid-delay-ms', type=float, default=200)
+    args = arg_parser.parse_args()
+
+    if args.command == 'record':
+        fixtures = record(args.fixture_dir, args.ingredients, args.cuisine, args.max_recipes, args.browser)
+        print(f'Recorded {len(fixtures.manifest["recipes"])} recipe pages into {args.fixture_dir}')
+        return
+
+    server = ReplayServer(args.fixture_dir, args.host, args.port,
+                          grid_size=args.grid_size, grid_delay=args.grid_delay_ms / 1e3)
+    print(f'PRODUCERECIPE_GOOGLE_SEARCH_URL={server.google_search_url}')
+    print(f'PRODUCERECIPE_BING_SEARCH_URL={server.bing_search_url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# Converts the keras classifier into a float16 or int8 quantized TFLite model
+# Usage: python convert_model.py --quantize float16
+#        python convert_model.py --quantize int8 --calibration-dir path/to/images
+import argparse
+import os
+import random
+
+import numpy as np
+import tensorflow as tf
+
+import model_helper as mh
+
+
+def representative_dataset(calibration_dir, n_samples=200):
+    paths = [os.path.join(root, f) for root, _, files in os.walk(calibration_dir) for f in files
+             if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+    random.Random(0).shuffle(paths)
+
+    def gen():
+        for path in paths[:n_samples]:
+            yield [np.expand_dims(mh.load_image(path), axis=0)]
+
+    return gen
+
+
+def convert(model_file, out_file, quantize, calibration_dir=None):
+    model = mh.load_saved_model(model_file, backend='keras')
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if quantize == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == 'int8':
+        if not calibration_dir:
+            raise ValueError('int8 quantization needs --calibration-dir for the representative dataset')
+        # Keep float input/output so the model is a drop-in for predict(), only the weights/activations are int8
+        converter.representative_dataset = representative_dataset(calibration_dir)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif quantize != 'none':
+        raise ValueError(f'Unknown quantization: {quantize}')
+
+    with open(out_file, 'wb') as f:
+        f.write(converter.convert())
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--model', default='resnetv2_250_cls_92_acc.hdf5')
+    arg_parser.add_argument('--quantize', choices=['none', 'float16', 'int8'], default='float16')
+    arg_parser.add_argument('--calibration-dir', default=None)
+    arg_parser.add_argument('--out', default=None)
+    args = arg_parser.parse_args()
+
+    out_file = args.out or f'{os.path.splitext(args.model)[0]}_{args.quantize}.tflite'
+    convert(args.model, out_file, args.quantize, args.calibration_dir)
+    print(f'Wrote {out_file} ({os.path.getsize(out_file) / 1e6:.1f} MB)')
+
+
+if __name__ == '__main__':
+    main()
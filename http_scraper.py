@@ -0,0 +1,97 @@
+from bs4 import BeautifulSoup, Comment, NavigableString
+from typing import Optional
+from urllib.parse import urljoin
+
+import requests
+
+from http_session import HEADERS, REQUEST_TIMEOUT, get_session  # noqa: F401
+import search_results as sr
+import telemetry
+
+# lxml is several times faster than the builtin parser, use it when it is installed
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+# Tags that start a new line in the rendered text, so card text splits the same way selenium's .text does
+BLOCK_TAGS = {'address', 'article', 'br', 'div', 'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header',
+              'li', 'ol', 'p', 'section', 'table', 'tr', 'ul'}
+
+
+def _inner_text(el) -> Optional[str]:
+    if el is None:
+        return None
+    parts = []
+    for node in el.descendants:
+        if isinstance(node, Comment):
+            continue
+        if isinstance(node, NavigableString):
+            parts.append(str(node))
+        elif node.name in BLOCK_TAGS:
+            parts.append('\n')
+    lines = (' '.join(line.split()) for line in ''.join(parts).split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+
+def _select_text(root, selector: str) -> Optional[str]:
+    return _inner_text(root.select_one(selector))
+
+
+def _select_attr(root, selector: str, name: str, base_url: Optional[str] = None) -> Optional[str]:
+    el = root.select_one(selector)
+    if el is None or not el.has_attr(name):
+        return None
+    # Match selenium's get_attribute('href'/'src'), which returns the resolved absolute URL
+    return urljoin(base_url, el[name]) if base_url else el[name]
+
+
+def parse_google_html(html: str, base_url: str = sr.GOOGLE_SEARCH_URL) -> list:
+    soup = BeautifulSoup(html, HTML_PARSER)
+    return [{
+        'title': _select_text(card, '.hfac6d'),
+        'link': _select_attr(card, '.v1uiFd a', 'href', base_url),
+        'image': _select_attr(card, '.v1uiFd img', 'src', base_url),
+        'source': _select_text(card, '.KuNgxf'),
+        'total_time': _select_text(card, '.wHYlTd'),
+        'ingredients': _select_text(card, '.LDr9cf'),
+        'ratings': _select_text(card, '.YDIN4c'),
+        'reviews': _select_text(card, '.HypWnf'),
+    } for card in soup.select('.YwonT')]
+
+
+def parse_bing_html(html: str, limit: int, base_url: str = sr.BING_SEARCH_URL) -> list:
+    soup = BeautifulSoup(html, HTML_PARSER)
+    return [{
+        'title': _select_text(card, '.rwtitle'),
+        'link': _select_attr(card, '.b_responsiveWaterfallItemCard', 'data-prmurl'),
+        'image': _select_attr(card, '.rwimage img', 'src', base_url),
+        'tags': _select_text(card, '.rwtags'),
+        'rating_label': _select_attr(card, '.rwtags .csrc', 'aria-label'),
+    } for card in soup.select('.wfrGridCell', limit=limit)]
+
+
+def _fetch(url: str, session: Optional[requests.Session]) -> str:
+    req = (session or get_session()).get(url, timeout=REQUEST_TIMEOUT)
+    req.raise_for_status()
+    return req.text
+
+
+@telemetry.timed('scrape', engine='google', path='http')
+def scrape_recipes_google(ingredients: list, cuisine: str, session: Optional[requests.Session] = None) -> dict:
+    url = sr.google_search_url(ingredients, cuisine)
+    cards = parse_google_html(_fetch(url, session), base_url=url)
+    telemetry.count('cards_extracted', len(cards), engine='google', path='http')
+    return sr.google_results_from_cards(cards)
+
+
+@telemetry.timed('scrape', engine='bing', path='http')
+def scrape_recipes_bing(ingredients: list, cuisine: str, limit: int,
+                        session: Optional[requests.Session] = None) -> dict:
+    # Only the server-rendered first page of the grid is available without a browser, the
+    # lazily loaded remainder needs the selenium engine
+    url = sr.bing_search_url(ingredients, cuisine)
+    cards = parse_bing_html(_fetch(url, session), limit, base_url=url)
+    telemetry.count('cards_extracted', len(cards), engine='bing', path='http')
+    return sr.bing_results_from_cards(cards)
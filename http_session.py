@@ -0,0 +1,28 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Shared HTTP session for the browser-free scrapers and recipe fetching, kept free of any HTML parser imports
+
+REQUEST_TIMEOUT = 10
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:102.0) Gecko/20100101 Firefox/102.0',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    # One keep-alive session per process, shared between threads
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers.update(HEADERS)
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+    return _session
@@ -0,0 +1,116 @@
+from collections import Counter
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class InferenceServer:
+    """In-process micro-batching server, coalesces predictions from concurrent sessions into one forward pass."""
+
+    def __init__(self, model, max_batch_size: int = 32, max_wait_ms: float = 10, max_queue: int = 256):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batch_sizes = Counter()
+        self.requests = 0
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        # A request that did not fit into the previous batch, it starts the next one
+        self._carry = None
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='inference-server', daemon=True)
+        self._thread.start()
+
+    def submit(self, x: np.ndarray) -> Future:
+        # x is an already preprocessed (n, 224, 224, 3) batch, the future resolves to its (n, n_classes) probabilities
+        if self._stopped:
+            raise RuntimeError('Inference server is stopped')
+        future = Future()
+        self._queue.put((x, future))
+        return future
+
+    def stop(self):
+        self._stopped = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self) -> list:
+        item, self._carry = self._carry or self._queue.get(), None
+        if item is None:
+            return []
+
+        pending = [item]
+        rows = len(item[0])
+        deadline = time.monotonic() + self.max_wait
+
+        while rows < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish what we already have, the loop exits on the next _collect
+                self._queue.put(None)
+                break
+            if rows + len(item[0]) > self.max_batch_size:
+                # Capped on rows, not requests, one submit can hold several images
+                self._carry = item
+                break
+            pending.append(item)
+            rows += len(item[0])
+
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            if not pending:
+                break
+            self._predict(pending)
+
+    def _predict(self, pending: list):
+        try:
+            batch = np.concatenate([x for x, _ in pending])
+        except Exception as e:
+            # One request with the wrong shape or dtype, run the rest on their own so only that one fails
+            if len(pending) == 1:
+                pending[0][1].set_exception(e)
+            else:
+                for item in pending:
+                    self._predict([item])
+            return
+
+        with self._lock:
+            self.batch_sizes[len(batch)] += 1
+            self.requests += len(pending)
+
+        try:
+            probs = np.asarray(self.model.predict_on_batch(batch))
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+
+        start = 0
+        for x, future in pending:
+            future.set_result(probs[start:start + len(x)])
+            start += len(x)
+
+    def stats(self) -> dict:
+        with self._lock:
+            batches = sum(self.batch_sizes.values())
+            rows = sum(size * count for size, count in self.batch_sizes.items())
+            return {
+                'queue_depth': self._queue.qsize(),
+                'requests': self.requests,
+                'batches': batches,
+                'mean_batch_size': rows / batches if batches else 0.0,
+                'batch_size_histogram': dict(sorted(self.batch_sizes.items())),
+            }
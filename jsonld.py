@@ -0,0 +1,63 @@
+from collections import deque
+from typing import Iterator, Optional
+import json
+import re
+
+# Matches each <script type="application/ld+json"> block on the raw bytes, no DOM is built
+JSONLD_SCRIPT_RE = re.compile(
+    rb'<script\b[^>]*?\btype\s*=\s*["\']?application/ld\+json["\']?[^>]*>(.*?)</script\s*>',
+    re.IGNORECASE | re.DOTALL,
+)
+CDATA_RE = re.compile(rb'^\s*(?://\s*)?<!\[CDATA\[|(?://\s*)?\]\]>\s*$')
+
+# Containers a Recipe node can be nested in
+NESTED_KEYS = ('@graph', 'mainEntity', 'mainEntityOfPage')
+
+
+def iter_jsonld_blocks(data: bytes) -> Iterator[object]:
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    for match in JSONLD_SCRIPT_RE.finditer(data):
+        block = CDATA_RE.sub(b'', match.group(1)).strip()
+        if not block:
+            continue
+        try:
+            # strict=False tolerates raw newlines/tabs inside strings, which a lot of sites emit
+            yield json.loads(block.decode('utf-8', errors='replace'), strict=False)
+        except json.JSONDecodeError:
+            continue
+
+
+def is_recipe(node: object) -> bool:
+    if not isinstance(node, dict):
+        return False
+    types = node.get('@type')
+    if not isinstance(types, list):
+        types = [types]
+    # Accept prefixed forms such as "schema:Recipe" or "http://schema.org/Recipe"
+    return any(isinstance(t, str) and re.split(r'[:/]', t)[-1] == 'Recipe' for t in types)
+
+
+def find_recipe_node(obj: object) -> Optional[dict]:
+    # Breadth first through top-level lists and @graph style containers
+    queue = deque([obj])
+    while queue:
+        node = queue.popleft()
+        if isinstance(node, list):
+            queue.extend(node)
+        elif isinstance(node, dict):
+            if is_recipe(node):
+                return node
+            for key in NESTED_KEYS:
+                if isinstance(node.get(key), (list, dict)):
+                    queue.append(node[key])
+    return None
+
+
+def extract_recipe_jsonld(data: bytes) -> Optional[dict]:
+    # Stops at the first block holding a Recipe, later blocks are never decoded
+    for block in iter_jsonld_blocks(data):
+        recipe = find_recipe_node(block)
+        if recipe is not None:
+            return recipe
+    return None
@@ -1,26 +1,243 @@
 import numpy as np
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
-from tensorflow.keras.applications import resnet_v2
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
 import json
+import os
+import threading
 
+import telemetry
 
+IMG_SIZE = (224, 224)
+
+
+def preprocess_pixels(pixels):
+    # Same as keras img_to_array + resnet_v2.preprocess_input (scale to [-1, 1]), without importing tensorflow
+    return np.asarray(pixels, dtype=np.float32) / 127.5 - 1.0
+
+
+def preprocess_image(img):
+    test_image = img.convert('RGB').resize(IMG_SIZE)
+    test_image = preprocess_pixels(test_image)
+
+    return test_image
+
+
+def decode_image(src, size=IMG_SIZE):
+    # Also used by the upload cache, so both paths give the model identical pixels for the same bytes
+    if hasattr(src, 'seek'):
+        src.seek(0)
+    img = Image.open(src)
+    # JPEG decoder can scale by 1/2, 1/4 or 1/8 while decoding, so the full resolution bitmap is never built
+    img.draft('RGB', size)
+
+    return img.convert('RGB')
+
+
+def load_image(src, size=IMG_SIZE):
+    return preprocess_image(decode_image(src, size))
+
+
+def iter_preprocessed_batches(sources, batch_size=32, max_workers=4):
+    # Decode/resize on a thread pool (PIL releases the GIL) and yield float32 batches in upload order
+    # as soon as they are ready, keeping at most two batches in flight
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        batch = []
+
+        for src in sources:
+            pending.append(executor.submit(load_image, src))
+            if len(pending) < 2 * batch_size:
+                continue
+            batch.append(pending.popleft().result())
+            if len(batch) == batch_size:
+                yield np.stack(batch)
+                batch = []
+
+        while pending:
+            batch.append(pending.popleft().result())
+            if len(batch) == batch_size:
+                yield np.stack(batch)
+                batch = []
+
+        if batch:
+            yield np.stack(batch)
+
+
+def read_bytes(src):
+    if isinstance(src, (str, os.PathLike)):
+        with open(src, 'rb') as f:
+            return f.read()
+    if hasattr(src, 'getvalue'):
+        return src.getvalue()
+    src.seek(0)
+    return src.read()
+
+
+def decode_predictions(pred_probs, classes):
+    pred_idx = pred_probs.argmax(axis=1)
+    pred_max = pred_probs.max(axis=1)
+
+    return [(classes[int(i)], p) for i, p in zip(pred_idx, pred_max)]
+
+
+@telemetry.timed('predict', path='single')
 def predict(img, model, classes):
-    test_image = img.resize((224,224))
-    test_image = image.img_to_array(test_image)
-    test_image = resnet_v2.preprocess_input(test_image)
+    test_image = preprocess_image(img)
     test_image = np.expand_dims(test_image, axis=0)
          
     pred_prob = model.predict(test_image)
+    telemetry.count('images_classified')
     pred_class = classes[pred_prob.argmax()]  # find the predicted class
     result = (pred_class, pred_prob.max())
     
     return result
 
 
-def load_saved_model(model_file):
-    model = load_model(model_file)
-    return model
+@telemetry.timed('predict', path='batch')
+def predict_batch(images, model, classes, batch_size=32):
+    if not images:
+        return []
+
+    # Stack everything into a single (N, 224, 224, 3) tensor so keras runs a few large forward passes
+    test_images = np.stack([preprocess_image(img) for img in images])
+
+    pred_probs = model.predict(test_images, batch_size=batch_size, verbose=0)
+    telemetry.count('images_classified', len(images))
+
+    return decode_predictions(pred_probs, classes)
+
+
+def predict_stream(sources, model, classes, batch_size=32, max_workers=4):
+    # Inference on the first batch starts while the remaining uploads are still being decoded
+    for test_images in iter_preprocessed_batches(sources, batch_size, max_workers):
+        with telemetry.span('predict', path='stream'):
+            pred_probs = model.predict_on_batch(test_images)
+        telemetry.count('images_classified', len(test_images))
+        yield from decode_predictions(np.asarray(pred_probs), classes)
+
+
+def _cache_lookup(keys, cache):
+    results = [cache.get(key) for key in keys]
+    missing = [idx for idx, result in enumerate(results) if result is None]
+    telemetry.count('prediction_cache', len(keys) - len(missing), result='hit')
+    telemetry.count('prediction_cache', len(missing), result='miss')
+
+    return results, missing
+
+
+def predict_cached(sources, model, classes, cache, batch_size=32, max_workers=4):
+    # Only the uploads whose bytes we have not seen for this model version go through inference
+    sources = list(sources)
+    keys = [cache.key(read_bytes(src)) for src in sources]
+    results, missing = _cache_lookup(keys, cache)
+    if missing:
+        preds = predict_stream([sources[idx] for idx in missing], model, classes, batch_size, max_workers)
+        for idx, result in zip(missing, preds):
+            cache.put(keys[idx], result)
+            results[idx] = result
+
+    return results
+
+
+def predict_pixels_cached(keys, pixels, model, classes, cache, batch_size=32):
+    # predict_cached for inputs that were already decoded and resized to IMG_SIZE (uint8 RGB arrays),
+    # with their cache keys computed up front, so nothing is re-read or re-decoded
+    results, missing = _cache_lookup(keys, cache)
+    for start in range(0, len(missing), batch_size):
+        batch_idx = missing[start:start + batch_size]
+        test_images = preprocess_pixels(np.stack([pixels[idx] for idx in batch_idx]))
+        with telemetry.span('predict', path='pixels'):
+            pred_probs = model.predict_on_batch(test_images)
+        telemetry.count('images_classified', len(batch_idx))
+
+        for idx, result in zip(batch_idx, decode_predictions(np.asarray(pred_probs), classes)):
+            cache.put(keys[idx], result)
+            results[idx] = result
+
+    return results
+
+
+class TFLiteModel:
+    # Wraps a tflite interpreter behind the subset of the keras Model API used in this module,
+    # so predict/predict_batch/predict_stream work unchanged on either backend
+
+    def __init__(self, model_file, num_threads=None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self.interpreter = Interpreter(model_path=model_file, num_threads=num_threads)
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        self.batch_size = None
+        # One interpreter is shared by every session and is not thread-safe, resize/set/invoke/get must not interleave
+        self._lock = threading.Lock()
+
+    def _resize(self, batch_size):
+        if batch_size != self.batch_size:
+            shape = [batch_size, *self.input_details['shape'][1:]]
+            self.interpreter.resize_tensor_input(self.input_details['index'], shape)
+            self.interpreter.allocate_tensors()
+            self.batch_size = batch_size
+
+    def predict_on_batch(self, x):
+        # int8 models take quantized input and produce quantized output
+        in_scale, in_zero = self.input_details['quantization']
+        if self.input_details['dtype'] != np.float32 and in_scale:
+            x = np.round(x / in_scale + in_zero)
+        x = x.astype(self.input_details['dtype'])
+
+        with self._lock:
+            self._resize(len(x))
+            self.interpreter.set_tensor(self.input_details['index'], x)
+            self.interpreter.invoke()
+            y = self.interpreter.get_tensor(self.output_details['index'])
+
+        out_scale, out_zero = self.output_details['quantization']
+        if self.output_details['dtype'] != np.float32 and out_scale:
+            y = (y.astype(np.float32) - out_zero) * out_scale
+
+        return y
+
+    def predict(self, x, batch_size=32, verbose=0):
+        return np.concatenate([self.predict_on_batch(x[i:i + batch_size]) for i in range(0, len(x), batch_size)])
+
+
+class InferenceClient:
+    # Looks like a keras model to the predict helpers, but forwards every batch to a shared
+    # InferenceServer so concurrent sessions get coalesced into larger forward passes
+
+    def __init__(self, server, timeout=60):
+        self.server = server
+        self.timeout = timeout
+
+    def predict_on_batch(self, x):
+        return self.server.submit(x).result(timeout=self.timeout)
+
+    def predict(self, x, batch_size=32, verbose=0):
+        futures = [self.server.submit(x[i:i + batch_size]) for i in range(0, len(x), batch_size)]
+        return np.concatenate([f.result(timeout=self.timeout) for f in futures])
+
+
+def load_saved_model(model_file, backend=None, num_threads=None):
+    # Backend defaults to the file extension: .tflite -> tflite interpreter, anything else -> keras
+    if backend is None:
+        backend = 'tflite' if model_file.endswith('.tflite') else 'keras'
+
+    if backend == 'tflite':
+        return TFLiteModel(model_file, num_threads=num_threads)
+    elif backend == 'keras':
+        # tensorflow takes seconds to import, only pay for it when the keras backend is actually used
+        import tensorflow as tf
+        if num_threads:
+            # Only possible before tensorflow runs its first op in this process
+            tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+        return tf.keras.models.load_model(model_file)
+    else:
+        raise ValueError(f'Unknown model backend: {backend}')
 
 
 def get_classes(class_file):
@@ -30,4 +247,3 @@ def get_classes(class_file):
     class_names = dict((v, k) for k, v in class_indices.items())
 
     return class_names
-
@@ -0,0 +1,171 @@
+from collections import OrderedDict
+from typing import Optional
+import hashlib
+import json
+import os
+import threading
+
+
+def model_version(model_file: str) -> str:
+    # Cheap fingerprint of the model artifact, re-hashing a 120MB file on every start is not worth it
+    st = os.stat(model_file)
+    return f'{os.path.basename(model_file)}:{st.st_size}:{int(st.st_mtime)}'
+
+
+class PredictionCache:
+    """Content addressed (class, probability) cache with an in-memory LRU and an optional on-disk tier."""
+
+    def __init__(self, version: str, max_items: int = 1024, disk_dir: str = None, max_disk_bytes: int = 64 * 2**20):
+        self.version = version
+        self.max_items = max_items
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._scan_disk())
+
+    def key(self, data: bytes) -> str:
+        h = hashlib.blake2b(data, digest_size=20)
+        h.update(self.version.encode())
+        return h.hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f'{key}.json')
+
+    def get(self, key: str):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, 'r') as f:
+                    value = tuple(json.load(f))
+                os.utime(path)  # mtime doubles as last access time for eviction
+            except (OSError, ValueError):
+                pass
+            else:
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                self._put_memory(key, value)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _put_memory(self, key: str, value: tuple):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def put(self, key: str, value: tuple):
+        value = (value[0], float(value[1]))
+        self._put_memory(key, value)
+
+        if self.disk_dir:
+            # The disk tier is only an optimization, a full disk or a permissions error must not fail the prediction
+            try:
+                self._put_disk(key, value)
+            except OSError:
+                pass
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    def _put_disk(self, key: str, value: tuple):
+        path = self._disk_path(key)
+        data = json.dumps(value).encode()
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            # Overwriting a key only changes the total by the size difference
+            try:
+                old_size = os.stat(path).st_size
+            except OSError:
+                old_size = 0
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            self._disk_bytes += len(data) - old_size
+
+    def _scan_disk(self) -> list:
+        # (path, size, mtime) of every cache file. Other threads and processes evict from the same directory,
+        # so files can vanish between listing and stat, those are skipped
+        entries = []
+        try:
+            listing = list(os.scandir(self.disk_dir))
+        except OSError:
+            return entries
+        for entry in listing:
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append((entry.path, st.st_size, st.st_mtime))
+        return entries
+
+    def _evict_disk(self):
+        # Drop least recently used files until we are back under 90% of the cap
+        entries = sorted(self._scan_disk(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_disk_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Evicted by someone else, the space is freed all the same
+                pass
+            except OSError:
+                continue
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'memory_items': len(self._memory),
+                'disk_bytes': self._disk_bytes,
+            }
+
+
+_default_caches = {}
+_default_caches_lock = threading.Lock()
+
+
+def get_prediction_cache(model_file: str, disk_dir: Optional[str] = None) -> PredictionCache:
+    # One cache per model file for the whole process. The model is fingerprinted once, here, and not on every rerun
+    with _default_caches_lock:
+        cache = _default_caches.get((model_file, disk_dir))
+        if cache is None:
+            cache = _default_caches[(model_file, disk_dir)] = PredictionCache(model_version(model_file),
+                                                                             disk_dir=disk_dir)
+    return cache
@@ -0,0 +1,119 @@
+from collections import namedtuple
+from typing import Optional
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'producerecipe', 'recipes.sqlite')
+
+CacheEntry = namedtuple('CacheEntry', ['json_ld', 'etag', 'last_modified', 'fetched_at'])
+
+
+class RecipeCache:
+    """SQLite cache of extracted recipe JSON-LD per URL, with HTTP validators for conditional revalidation."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: float = 24 * 3600, max_bytes: int = 256 * 2**20,
+                 offline: bool = False):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS recipes (
+                url TEXT PRIMARY KEY,
+                json_ld TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            )""")
+        self._conn.execute('CREATE INDEX IF NOT EXISTS recipes_accessed_at ON recipes (accessed_at)')
+        self._total_bytes = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM recipes').fetchone()[0]
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT json_ld, etag, last_modified, fetched_at FROM recipes WHERE url = ?', (url,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute('UPDATE recipes SET accessed_at = ? WHERE url = ?', (time.time(), url))
+
+        json_ld, etag, last_modified, fetched_at = row
+        return CacheEntry(json.loads(json_ld) if json_ld is not None else None, etag, last_modified, fetched_at)
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return time.time() - entry.fetched_at < self.ttl
+
+    def put(self, url: str, json_ld: Optional[dict], etag: Optional[str] = None, last_modified: Optional[str] = None):
+        # Pages without a parsable recipe are stored as NULL so repeat lookups skip the network too
+        data = json.dumps(json_ld) if json_ld is not None else None
+        size = len(url) + (len(data) if data else 0)
+        now = time.time()
+
+        with self._lock:
+            old = self._conn.execute('SELECT size FROM recipes WHERE url = ?', (url,)).fetchone()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO recipes VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, data, etag, last_modified, now, now, size))
+            self._total_bytes += size - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def revalidated(self, url: str):
+        # Server answered 304, the stored JSON-LD is good for another TTL
+        now = time.time()
+        with self._lock:
+            self._conn.execute('UPDATE recipes SET fetched_at = ?, accessed_at = ? WHERE url = ?', (now, now, url))
+
+    def _evict(self):
+        # Least recently accessed first, down to 90% of the cap so eviction does not run on every put
+        target = self.max_bytes * 0.9
+        evicted = []
+        for url, size in self._conn.execute('SELECT url, size FROM recipes ORDER BY accessed_at'):
+            if self._total_bytes <= target:
+                break
+            evicted.append((url,))
+            self._total_bytes -= size
+        self._conn.executemany('DELETE FROM recipes WHERE url = ?', evicted)
+
+    def conditional_headers(self, entry: Optional[CacheEntry]) -> dict:
+        headers = {}
+        if entry is not None and entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_recipe_cache() -> Optional[RecipeCache]:
+    # PRODUCERECIPE_RECIPE_CACHE= (empty) turns the cache off, PRODUCERECIPE_OFFLINE=1 never touches the network
+    global _default_cache
+    path = os.environ.get('PRODUCERECIPE_RECIPE_CACHE', DEFAULT_CACHE_PATH)
+    if not path:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = RecipeCache(
+                path=path,
+                ttl=float(os.environ.get('PRODUCERECIPE_RECIPE_CACHE_TTL', 24 * 3600)),
+                offline=os.environ.get('PRODUCERECIPE_OFFLINE', '') == '1',
+            )
+    return _default_cache
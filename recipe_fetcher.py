@@ -0,0 +1,136 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+from urllib.parse import urlsplit
+import json
+import threading
+import time
+
+import requests
+
+from http_session import REQUEST_TIMEOUT, get_session
+from jsonld import extract_recipe_jsonld
+from recipe_cache import RecipeCache, get_recipe_cache
+import telemetry
+
+# Recipe page fetching and JSON-LD extraction, kept apart from recipe_scraper so this path never imports selenium
+
+
+# Retry policy for recipe pages, transient statuses are retried with exponential backoff
+RECIPE_FETCH_RETRIES = 2
+RECIPE_FETCH_BACKOFF = 0.5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HostLimiter:
+    """Caps the number of requests in flight per host, so bulk fetches do not hammer a single site."""
+
+    def __init__(self, per_host: int):
+        self.per_host = per_host
+        self._lock = threading.Lock()
+        self._slots = defaultdict(lambda: threading.BoundedSemaphore(self.per_host))
+
+    @contextmanager
+    def slot(self, url: str):
+        with self._lock:
+            semaphore = self._slots[urlsplit(url).netloc]
+        with semaphore:
+            yield
+
+
+def fetch_recipe_page(url: str, session: Optional[requests.Session] = None,
+                      limiter: Optional[HostLimiter] = None, headers: Optional[dict] = None,
+                      retries: int = RECIPE_FETCH_RETRIES,
+                      backoff: float = RECIPE_FETCH_BACKOFF) -> Optional[requests.Response]:
+    session = session or get_session()
+    for attempt in range(retries + 1):
+        try:
+            if limiter:
+                with limiter.slot(url):
+                    req = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+            else:
+                req = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+            if req.status_code not in RETRY_STATUSES:
+                return req if req.ok else None
+        except requests.RequestException:
+            pass
+        if attempt < retries:
+            telemetry.count('recipe_fetch_retries')
+            time.sleep(backoff * 2 ** attempt)
+    telemetry.count('recipe_fetch_failures')
+    return None
+
+
+def fetch_recipe_html(url: str, session: Optional[requests.Session] = None,
+                      limiter: Optional[HostLimiter] = None) -> Optional[bytes]:
+    req = fetch_recipe_page(url, session, limiter)
+    return req.content if req is not None else None
+
+
+def parse_recipe_json(html: bytes) -> Optional[dict]:
+    return extract_recipe_jsonld(html)
+
+
+def parse_recipe_json_soup(html: bytes) -> Optional[dict]:
+    # Previous full-DOM approach, only looks at the first ld+json script. Kept for benchmarking
+    from bs4 import BeautifulSoup
+
+    parser = "html.parser"
+    soup = BeautifulSoup(html, parser)
+    script = soup.find("script", {"type": "application/ld+json"})
+    if script and script.contents:
+        try:
+            parsed = json.loads(script.contents[0])
+            # print(json.dumps(parsed, indent=4))  # pretty print json file
+            return parsed
+        except json.JSONDecodeError:
+            return None
+    return None
+
+
+@telemetry.timed('recipe_fetch')
+def get_recipe_json(url: str, session: Optional[requests.Session] = None,
+                    limiter: Optional[HostLimiter] = None, cache: Optional[RecipeCache] = None) -> Optional[dict]:
+    cache = cache or get_recipe_cache()
+    if cache is None:
+        html = fetch_recipe_html(url, session, limiter)
+        return parse_recipe_json(html) if html else None
+
+    entry = cache.get(url)
+    if entry is not None and (cache.offline or cache.is_fresh(entry)):
+        telemetry.count('recipe_cache', result='hit')
+        return entry.json_ld
+    if cache.offline:
+        telemetry.count('recipe_cache', result='offline_miss')
+        return None
+
+    # Past the TTL, ask the site whether the page changed before downloading and parsing it again
+    req = fetch_recipe_page(url, session, limiter, headers=cache.conditional_headers(entry))
+    if req is None:
+        telemetry.count('recipe_cache', result='stale' if entry is not None else 'miss')
+        return entry.json_ld if entry is not None else None
+    if req.status_code == 304 and entry is not None:
+        telemetry.count('recipe_cache', result='revalidated')
+        cache.revalidated(url)
+        return entry.json_ld
+
+    telemetry.count('recipe_cache', result='miss')
+
+    json_ld = parse_recipe_json(req.content)
+    cache.put(url, json_ld, req.headers.get('ETag'), req.headers.get('Last-Modified'))
+    return json_ld
+
+
+def get_recipe_jsons(urls: list, concurrency: int = 16, per_host: int = 4,
+                     session: Optional[requests.Session] = None,
+                     cache: Optional[RecipeCache] = None) -> Iterator[Tuple[str, Optional[dict]]]:
+    # Yields (url, json_ld) pairs in completion order, closing the generator early cancels what has not started
+    limiter = HostLimiter(per_host)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        futures = {executor.submit(get_recipe_json, url, session, limiter, cache): url for url in urls}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
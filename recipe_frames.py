@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+# One compiled pattern per field, applied column-wise with the pandas string engine instead of per-row Python
+COUNT_PATTERN = r'(?P<value>\d+(?:\.\d+)?)\s*(?P<suffix>[kKmM]?)'
+# Each number is tied to its own unit and searched for independently, so a range like "10-15 min" or
+# "5 to 10 min" counts as the number next to the unit, its upper bound
+HOURS_PATTERN = r'(\d+)\s*h(?:ou)?rs?'
+MINUTES_PATTERN = r'(\d+)\s*min'
+LEADING_NUMBER_PATTERN = r'^\s*(\d+)'
+
+COUNT_MULTIPLIERS = {'': 1.0, 'k': 1e3, 'K': 1e3, 'm': 1e6, 'M': 1e6}
+
+# Low below 0.33, Medium from 0.33 up to and including 0.66, High above
+CONFIDENCE_BINS = [-np.inf, 0.33, np.nextafter(0.66, np.inf), np.inf]
+CONFIDENCE_LABELS = ['Low', 'Medium', 'High']
+
+
+def parse_counts(s: pd.Series) -> pd.Series:
+    # "1.2K reviews" -> 1200, "(350)" -> 350
+    parts = s.astype('string').str.replace(',', '', regex=False).str.extract(COUNT_PATTERN)
+    multiplier = parts['suffix'].map(COUNT_MULTIPLIERS).astype(float)
+    return (parts['value'].astype(float) * multiplier).round().astype('Int32')
+
+
+def parse_minutes(s: pd.Series) -> pd.Series:
+    # "1 hr 20 min" -> 80.0, "10-15 min" -> 15.0, rows with neither part stay NaN
+    s = s.astype('string')
+    hours = s.str.extract(HOURS_PATTERN)[0].astype(float)
+    minutes = s.str.extract(MINUTES_PATTERN)[0].astype(float)
+    return hours.mul(60).add(minutes, fill_value=0).astype('float32')
+
+
+def parse_leading_number(s: pd.Series) -> pd.Series:
+    # "350 cals" -> 350.0
+    return s.astype('string').str.extract(LEADING_NUMBER_PATTERN)[0].astype('float32')
+
+
+def confidence_levels(probability: pd.Series) -> pd.Series:
+    return pd.cut(probability, bins=CONFIDENCE_BINS, labels=CONFIDENCE_LABELS, right=False)
+
+
+def predictions_frame(pred_dict: dict) -> pd.DataFrame:
+    df = pd.DataFrame(pred_dict)
+    df['probability'] = df['probability'].astype(float)
+    df['confidence'] = confidence_levels(df['probability'])
+    return df
+
+
+def normalize_recipe_frame(recipe_dict: dict) -> pd.DataFrame:
+    df = pd.DataFrame(recipe_dict)
+
+    # Drop columns we won't be using
+    df = df.drop(['servings', 'ingredients'], axis=1, errors='ignore')
+
+    df['total_time'] = parse_minutes(df['total_time'])
+    if 'calories' in df.columns:
+        df['calories'] = parse_leading_number(df['calories'])
+    df['reviews'] = parse_counts(df['reviews'])
+    df['ratings'] = pd.to_numeric(df['ratings'], errors='coerce').astype('float32')
+    # Few distinct sites across hundreds of rows
+    df['source'] = df['source'].astype('category')
+
+    return df
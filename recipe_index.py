@@ -0,0 +1,254 @@
+from collections import Counter
+from typing import Iterable, Optional
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import search_results as sr
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'producerecipe', 'recipe_index.sqlite')
+DEFAULT_CLASSES_FILE = 'resnetv2_250_cls_92_acc.json'
+
+# What a Google search returns, also used for Bing when the query has no limit
+GOOGLE_RESULT_COUNT = 15
+
+WORD_RE = re.compile(r'[a-z]+')
+CUISINE_TERM = 'cuisine:{}'
+
+
+def _singular(word: str) -> str:
+    # Crude, but applied the same way to class names, queries and recipe text, so it only has to be consistent
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith(('oes', 'ches', 'shes', 'xes', 'sses')):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith(('ss', 'us')) and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def normalize_term(term: str) -> str:
+    # 'Bell-Peppers' -> 'bell pepper', class names use dashes where recipe titles use spaces
+    return ' '.join(_singular(word) for word in WORD_RE.findall(term.lower()))
+
+
+def _column_values(df, column: str) -> list:
+    # Plain floats and None, sqlite cannot bind numpy scalars or pandas NA
+    if column not in df.columns:
+        return [None] * len(df)
+    return [float(value) if notna else None for value, notna in zip(df[column].tolist(), df[column].notna())]
+
+
+class RecipeIndex:
+    """Inverted index from produce terms to previously scraped recipes, in a SQLite file shared like SearchCache."""
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH, vocabulary: Iterable[str] = (), ttl: float = 7 * 24 * 3600,
+                 min_matches: int = 5):
+        self.path = path
+        self.ttl = ttl
+        self.min_matches = min_matches
+        # Class names, the only terms pulled out of recipe titles and ingredient lists
+        self.vocabulary = {normalize_term(term) for term in vocabulary} - {''}
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # UPSERT needs SQLite 3.24 and the lookups need JSON1, fail here rather than on every add()
+        if sqlite3.sqlite_version_info < (3, 24, 0):
+            raise RuntimeError(f'RecipeIndex needs SQLite 3.24 or newer, this Python has {sqlite3.sqlite_version}')
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        try:
+            self._conn.execute("SELECT value FROM json_each('[]')")
+        except sqlite3.OperationalError:
+            self._conn.close()
+            raise RuntimeError('RecipeIndex needs an SQLite build with the JSON1 extension')
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS recipes (
+                id INTEGER PRIMARY KEY,
+                link TEXT NOT NULL,
+                engine TEXT NOT NULL,
+                data TEXT NOT NULL,
+                total_time REAL,
+                calories REAL,
+                ratings REAL,
+                reviews INTEGER,
+                indexed_at REAL NOT NULL,
+                UNIQUE (link, engine)
+            )""")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                recipe_id INTEGER NOT NULL,
+                PRIMARY KEY (term, recipe_id)
+            ) WITHOUT ROWID""")
+
+    def _recipe_terms(self, results: dict, i: int, query_terms: set) -> set:
+        text_parts = [results['title'][i] or '']
+        ingredients = results['ingredients'][i] if 'ingredients' in results else None
+        if ingredients:
+            text_parts.extend(ingredients)
+        text = f' {normalize_term(" ".join(text_parts))} '
+        return query_terms | {term for term in self.vocabulary if f' {term} ' in text}
+
+    def _accepted_terms(self, ingredient: str) -> set:
+        # A recipe indexed under 'apple' also counts for 'apple-granny-smith' when 'apple' is a class of its own
+        words = normalize_term(ingredient).split()
+        prefixes = {' '.join(words[:n]) for n in range(1, len(words))}
+        return {' '.join(words)} | (prefixes & self.vocabulary)
+
+    def add(self, ingredients: list, cuisine: str, engine: str, results: dict) -> int:
+        n_results = len(results.get('link', []))
+        if not n_results:
+            return 0
+
+        # Numeric metadata for ranking and filtering, parsed once here with the same code the app uses.
+        # Imported here so scrape workers, which import this module, do not load pandas at startup
+        import recipe_frames as frames
+
+        df = frames.normalize_recipe_frame(results)
+        metadata = {column: _column_values(df, column) for column in ('total_time', 'calories', 'ratings', 'reviews')}
+
+        query_terms = {normalize_term(ingredient) for ingredient in ingredients} - {''}
+        if cuisine != 'Any':
+            query_terms.add(CUISINE_TERM.format(cuisine.lower()))
+
+        now = time.time()
+        indexed = 0
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                for i in range(n_results):
+                    link = sr.canonical_link(results['link'][i])
+                    if link is None:
+                        continue
+                    row_engine = results['engine'][i] if results.get('engine') and results['engine'][i] else engine
+                    data = json.dumps({column: values[i] for column, values in results.items()})
+                    # Upsert then look the id up, RETURNING needs SQLite 3.35 and older system builds are common
+                    self._conn.execute("""
+                        INSERT INTO recipes (link, engine, data, total_time, calories, ratings, reviews, indexed_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (link, engine) DO UPDATE SET
+                            data = excluded.data, total_time = excluded.total_time, calories = excluded.calories,
+                            ratings = excluded.ratings, reviews = excluded.reviews, indexed_at = excluded.indexed_at""",
+                        (link, row_engine, data, metadata['total_time'][i], metadata['calories'][i],
+                         metadata['ratings'][i], metadata['reviews'][i], now))
+                    recipe_id, = self._conn.execute('SELECT id FROM recipes WHERE link = ? AND engine = ?',
+                                                    (link, row_engine)).fetchone()
+                    self._conn.executemany('INSERT OR IGNORE INTO postings VALUES (?, ?)',
+                                           [(term, recipe_id) for term in self._recipe_terms(results, i, query_terms)])
+                    indexed += 1
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return indexed
+
+    def lookup(self, ingredients: list, cuisine: str, engine: str, limit: Optional[int] = None) -> Optional[dict]:
+        # Returns a results_dict in the engine's schema, or None when the index does not cover the query well enough
+        accepted = {ingredient: self._accepted_terms(ingredient) for ingredient in set(ingredients)}
+        accepted = {ingredient: terms for ingredient, terms in accepted.items() if terms - {''}}
+        if not accepted:
+            return None
+        # Rows per engine a fresh scrape would return, 'All' is Google's page plus Bing's limit
+        quotas = {'Google': GOOGLE_RESULT_COUNT, 'Bing': limit or GOOGLE_RESULT_COUNT}
+        if engine != 'All':
+            quotas = {engine: quotas[engine]}
+        target = sum(quotas.values())
+
+        terms = set().union(*accepted.values())
+        cuisine_term = CUISINE_TERM.format(cuisine.lower()) if cuisine != 'Any' else None
+        if cuisine_term:
+            terms.add(cuisine_term)
+
+        with self._lock:
+            postings = self._conn.execute(
+                'SELECT term, recipe_id FROM postings WHERE term IN (SELECT value FROM json_each(?))',
+                (json.dumps(sorted(terms)),)).fetchall()
+        by_term = {}
+        for term, recipe_id in postings:
+            by_term.setdefault(term, set()).add(recipe_id)
+
+        matches = {ingredient: set().union(*(by_term.get(term, set()) for term in ingredient_terms))
+                   for ingredient, ingredient_terms in accepted.items()}
+        if cuisine_term:
+            allowed = by_term.get(cuisine_term, set())
+            matches = {ingredient: ids & allowed for ingredient, ids in matches.items()}
+        if any(len(ids) < self.min_matches for ids in matches.values()):
+            return None
+
+        overlap = Counter(recipe_id for ids in matches.values() for recipe_id in ids)
+        engines = list(quotas)
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT id, link, engine, data, ratings, reviews FROM recipes
+                WHERE id IN (SELECT value FROM json_each(?)) AND indexed_at >= ?
+                  AND engine IN (SELECT value FROM json_each(?))""",
+                (json.dumps(list(overlap)), time.time() - self.ttl, json.dumps(engines))).fetchall()
+
+        # Most requested produce first, then the most reviewed and best rated
+        rows.sort(key=lambda row: (-overlap[row[0]], -(row[5] or 0), -(row[4] or 0)))
+        ranked, seen, taken = [], set(), Counter()
+        for recipe_id, link, row_engine, data, _, _ in rows:
+            if link not in seen and taken[row_engine] < quotas[row_engine]:
+                seen.add(link)
+                taken[row_engine] += 1
+                ranked.append((recipe_id, row_engine, json.loads(data)))
+
+        full_matches = sum(overlap[recipe_id] == len(accepted) for recipe_id, _, _ in ranked)
+        if len(ranked) < target or full_matches < min(self.min_matches, target):
+            return None
+
+        if engine == 'Google':
+            results = sr.new_google_results()
+        elif engine == 'Bing':
+            results = sr.new_bing_results()
+        else:
+            results = {column: [] for column in sr.UNIFIED_COLUMNS}
+        for _, row_engine, data in ranked:
+            for column, values in results.items():
+                values.append(row_engine if column == 'engine' else data.get(column))
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            n_recipes, = self._conn.execute('SELECT COUNT(*) FROM recipes').fetchone()
+            n_terms, = self._conn.execute('SELECT COUNT(DISTINCT term) FROM postings').fetchone()
+        return {'recipes': n_recipes, 'terms': n_terms}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def load_vocabulary(classes_file: str) -> list:
+    # Same {class name: index} file as mh.get_classes
+    try:
+        with open(classes_file, 'r') as f:
+            return list(json.load(f))
+    except (OSError, ValueError):
+        return []
+
+
+def get_recipe_index() -> Optional[RecipeIndex]:
+    # PRODUCERECIPE_RECIPE_INDEX= (empty) turns the index off
+    global _default_index
+    path = os.environ.get('PRODUCERECIPE_RECIPE_INDEX', DEFAULT_INDEX_PATH)
+    if not path:
+        return None
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = RecipeIndex(
+                path,
+                vocabulary=load_vocabulary(os.environ.get('PRODUCERECIPE_CLASSES_FILE', DEFAULT_CLASSES_FILE)),
+                ttl=float(os.environ.get('PRODUCERECIPE_RECIPE_INDEX_TTL', 7 * 24 * 3600)),
+                min_matches=int(os.environ.get('PRODUCERECIPE_RECIPE_INDEX_MIN_MATCHES', 5)),
+            )
+    return _default_index
@@ -1,6 +1,134 @@
 from dataclasses import dataclass, field
+from html import unescape
+from typing import NamedTuple, Optional, Tuple
 import re
 
+from jsonld import find_recipe_node
+
+WHITESPACE_RE = re.compile(r'\s+')
+TAG_RE = re.compile(r'<[^>]+>')
+
+
+class Recipe(NamedTuple):
+    """Normalized schema.org Recipe, independent of how the site laid out its JSON-LD."""
+    name: Optional[str] = None
+    description: Optional[str] = None
+    author: Optional[str] = None
+    image: Optional[str] = None
+    servings: Optional[str] = None
+    ingredients: Tuple[str, ...] = ()
+    instructions: Tuple[str, ...] = ()
+    nutrition: Optional[str] = None
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.name and (self.ingredients or self.instructions))
+
+
+def _clean(value) -> Optional[str]:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    if not isinstance(value, str):
+        return None
+    if '<' in value:
+        value = TAG_RE.sub(' ', value)
+    if '&' in value:
+        value = unescape(value)
+    value = WHITESPACE_RE.sub(' ', value).strip()
+    return value or None
+
+
+def _first(value):
+    while isinstance(value, list):
+        if not value:
+            return None
+        value = value[0]
+    return value
+
+
+def _author(value) -> Optional[str]:
+    names = []
+    for author in value if isinstance(value, list) else [value]:
+        name = _clean(author.get('name')) if isinstance(author, dict) else _clean(author)
+        if name:
+            names.append(name)
+    return ', '.join(names) or None
+
+
+def _image(value) -> Optional[str]:
+    value = _first(value)
+    if isinstance(value, dict):
+        value = _first(value.get('url') or value.get('contentUrl'))
+    return _clean(value)
+
+
+def _ingredients(value) -> Tuple[str, ...]:
+    if isinstance(value, str):
+        value = value.split('\n')
+    if not isinstance(value, list):
+        return ()
+    cleaned = (_clean(ingredient) for ingredient in value)
+    return tuple(ingredient for ingredient in cleaned if ingredient)
+
+
+def _instructions(value) -> Tuple[str, ...]:
+    # Flattens plain strings, lists, HowToStep and (nested) HowToSection into one list of steps, in order
+    steps = []
+    stack = [value]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(reversed(node))
+        elif isinstance(node, dict):
+            if 'itemListElement' in node:
+                stack.append(node['itemListElement'])
+            else:
+                step = _clean(node.get('text') or node.get('name'))
+                if step:
+                    steps.append(step)
+        elif isinstance(node, str):
+            steps.extend(step for step in (_clean(line) for line in node.split('\n')) if step)
+    return tuple(steps)
+
+
+def _nutrition(value) -> Optional[str]:
+    if not isinstance(value, dict):
+        return None
+    lines = [f'{key}: {_clean(amount)}' for key, amount in value.items()
+             if not key.startswith('@') and _clean(amount)]
+    return '\n'.join(lines) or None
+
+
+def normalize_recipe(json_ld) -> Optional[Recipe]:
+    node = find_recipe_node(json_ld)
+    if node is None:
+        return None
+
+    return Recipe(
+        name=_clean(node.get('name')),
+        description=_clean(node.get('description')),
+        author=_author(node.get('author')),
+        image=_image(node.get('image')),
+        servings=_clean(_first(node.get('recipeYield'))),
+        ingredients=_ingredients(node.get('recipeIngredient', node.get('ingredients'))),
+        instructions=_instructions(node.get('recipeInstructions')),
+        nutrition=_nutrition(node.get('nutrition')),
+    )
+
+
+def parse_many(json_lds: list) -> dict:
+    # Columnar output, one list per Recipe field plus 'complete', with None/() for documents without a recipe
+    columns = {name: [] for name in Recipe._fields}
+    columns['complete'] = []
+    empty = Recipe()
+    for json_ld in json_lds:
+        recipe = normalize_recipe(json_ld) or empty
+        for name, value in zip(Recipe._fields, recipe):
+            columns[name].append(value)
+        columns['complete'].append(recipe.complete)
+    return columns
+
+
 @dataclass
 class RecipeItem:
     """Class for keeping track of a recipe item on a specific website."""
@@ -13,72 +141,25 @@ class RecipeItem:
     ingredients: str = field(default=None, init=False)
     instructions: str = field(default=None, init=False)
     nutrition: str = field(default=None, init=False)
+    recipe: Optional[Recipe] = field(default=None, init=False, repr=False)
 
     def fill_values(self) -> bool:
-        ### Type 1
-
-        # TODO: FIX
-        if isinstance(self.r, list):
+        recipe = normalize_recipe(self.r)
+        if recipe is None:
             return False
 
-        if '@graph' not in self.r.keys():
-            try:
-                self.name = self.r['name']
-                self.description = self.r['description']
-                self.author = self.r['author']['name']
-                self.image = self.r['image']
-
-                for ingredient in self.r['recipeIngredient']:
-                    fixed_ingredient = re.sub(r'\s+', ' ', ingredient.strip())
-                    self.ingredients = fixed_ingredient
-
-                for step in self.r['recipeInstructions']:
-                    fixed_step = re.sub(r'\s+', ' ', step.strip())
-                    self.instructions = fixed_step
-
-                return True
-            except:
-                return False
-
-
-        else:
-            try:
-                for d in self.r['@graph']:  # dict
-                    if 'Recipe' in d['@type']:  # list
-                        self.name = d['name']
-                        self.description = d['description']
-                        self.author = d['author']['name']
-                        self.image = d['image'][0]
-                        print(d['name'])
-                        print(d['description'])
-                        print(d['author']['name'])
-                        print(d['image'][0])
-                        self.servings = d['recipeYield'][0]
-                        print(d['recipeYield'][0], 'servings')
-                        self.servings = d['recipeIngredient']
-                        print(*d['recipeIngredient'], sep='\n')
-
-                        for step in d['recipeInstructions']:
-                            if 'text' in step.keys():
-                                if not self.instructions:
-                                    self.instructions = step['text']
-                                else:
-                                    self.instructions += '\n' + step['text'] + '\n'
-                                print(step['text'])
-
-                        self.nutrition = d['nutrition']
-
-                        return True
-            except:
-                return False
-
-                    # for n in d['nutrition']:
-                    #     if '@' not in n:
-                    #         if not self.nutrition:
-                    #             self.nutrition = f'{n}: {d["nutrition"][n]}'
-                    #         else:
-                    #             self.nutrition += '\n' + f'{n}: {d["nutrition"][n]}'
-                    #         print(f'{n}: {d["nutrition"][n]}')
+        self.recipe = recipe
+        self.name = recipe.name
+        self.description = recipe.description
+        self.author = recipe.author
+        self.image = recipe.image
+        self.servings = recipe.servings
+        # Display strings, ingredients as a markdown list and one paragraph per step
+        self.ingredients = '\n'.join(f'- {ingredient}' for ingredient in recipe.ingredients) or None
+        self.instructions = '\n\n'.join(recipe.instructions) or None
+        self.nutrition = recipe.nutrition
+
+        return recipe.complete
 
 
 if __name__ == '__main__':
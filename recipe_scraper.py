@@ -1,9 +1,10 @@
-from bs4 import BeautifulSoup
-from typing import Optional
-import json
-import requests
+from contextlib import contextmanager
+from typing import Iterator, Optional
+import atexit
+import os
+import queue
 import re
-import time
+import threading
 
 from selenium import webdriver
 from selenium.webdriver.support.ui import WebDriverWait
@@ -15,26 +16,35 @@ from selenium.webdriver.firefox.service import Service
 from selenium.webdriver.firefox.options import Options
 from webdriver_manager.firefox import GeckoDriverManager
 
+# Re-exported so existing callers keep working, new code should import recipe_fetcher directly
+from recipe_fetcher import (HostLimiter, RECIPE_FETCH_BACKOFF, RECIPE_FETCH_RETRIES, RETRY_STATUSES,  # noqa: F401
+                            fetch_recipe_html, fetch_recipe_page, get_recipe_json, get_recipe_jsons,
+                            parse_recipe_json, parse_recipe_json_soup)
+import search_results as sr
+import telemetry
+from wait_policy import WaitPolicy
 
-def get_recipe_json(url: str) -> Optional[dict]:
-    parser = "html.parser"
-    req = requests.get(url)
-    soup = BeautifulSoup(req.text, parser)
-    script = soup.find("script", {"type": "application/ld+json"})
-    if script and script.contents:
-        try:
-            parsed = json.loads(script.contents[0])
-            # print(json.dumps(parsed, indent=4))  # pretty print json file
-            return parsed
-        except json.JSONDecodeError:
-            return None
-    return None
+# Browsers kept alive per worker process, and how many searches one browser serves before it is recycled
+BROWSER_POOL_SIZE = int(os.environ.get('PRODUCERECIPE_BROWSER_POOL_SIZE', 2))
+BROWSER_MAX_USES = int(os.environ.get('PRODUCERECIPE_BROWSER_MAX_USES', 20))
+
+_geckodriver_path = None
+_geckodriver_lock = threading.Lock()
+
+
+def get_geckodriver_path() -> str:
+    # GeckoDriverManager hits the network to resolve the latest release, only do it once per process
+    global _geckodriver_path
+    with _geckodriver_lock:
+        if _geckodriver_path is None:
+            _geckodriver_path = GeckoDriverManager().install()
+    return _geckodriver_path
 
 
 def setup_webdriver() -> webdriver.Firefox:
     ff_options = Options()
     ff_options.add_argument('--headless')
-    service = Service(GeckoDriverManager().install())
+    service = Service(get_geckodriver_path())
     driver = webdriver.Firefox(
         options=ff_options,
         service=service,
@@ -42,230 +52,312 @@ def setup_webdriver() -> webdriver.Firefox:
     return driver
 
 
-def scrape_recipes_google(ingredients: list, cuisine: str) -> dict:
+class WebDriverPool:
+    """Bounded pool of headless browsers, recycled after max_uses searches or when they stop responding."""
 
-    driver = setup_webdriver()
+    def __init__(self, size: int = BROWSER_POOL_SIZE, max_uses: int = BROWSER_MAX_USES):
+        self.size = size
+        self.max_uses = max_uses
+        self._idle = queue.LifoQueue()
+        self._uses = {}
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._closed = False
 
-    ingredients_str = '+'.join(ingredients)
-    if cuisine == 'Any':
-        driver.get(f'https://www.google.com/search?q={ingredients_str}+vegetarian+recipe&hl=en-US')
-    else:
-        driver.get(f'https://www.google.com/search?q={ingredients_str}+{cuisine}+vegetarian+recipe&hl=en-US')
+    @staticmethod
+    def _is_healthy(driver: webdriver.Firefox) -> bool:
+        # A crashed geckodriver usually shows up as a urllib3 MaxRetryError or ConnectionError, not a WebDriverException
+        try:
+            driver.execute_script('return 1')
+            return True
+        except Exception:
+            return False
 
-    # buffer for everything to load
-    time.sleep(5)
+    @staticmethod
+    def _quit(driver: webdriver.Firefox):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def checkout(self, timeout: Optional[float] = None) -> webdriver.Firefox:
+        if self._closed:
+            raise RuntimeError('WebDriver pool is closed')
+        # acquire(timeout=-1) does not block on a semaphore, so no timeout has to mean a plain acquire()
+        acquired = self._slots.acquire() if timeout is None else self._slots.acquire(timeout=timeout)
+        if not acquired:
+            raise TimeoutException('Timed out waiting for a browser from the pool')
 
-    results_dict = {
-        'title': [],
-        'link': [],
-        'image': [],
-        'source': [],
-        'total_time': [],
-        'ingredients': [],
-        'ratings': [],
-        'reviews': []
-    }
+        try:
+            while True:
+                try:
+                    driver = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                if self._is_healthy(driver):
+                    return driver
+                self._discard(driver)
+
+            driver = setup_webdriver()
+            with self._lock:
+                self._uses[driver] = 0
+            return driver
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def checkin(self, driver: webdriver.Firefox, broken: bool = False):
+        with self._lock:
+            self._uses[driver] = self._uses.get(driver, 0) + 1
+            retire = broken or self._closed or self._uses[driver] >= self.max_uses
+
+        if not retire:
+            try:
+                # Drop the previous search page so the next checkout starts clean
+                driver.get('about:blank')
+            except Exception:
+                retire = True
+
+        if retire:
+            self._discard(driver)
+        else:
+            self._idle.put(driver)
+        self._slots.release()
+
+    def _discard(self, driver: webdriver.Firefox):
+        with self._lock:
+            self._uses.pop(driver, None)
+        self._quit(driver)
+
+    @contextmanager
+    def driver(self, timeout: Optional[float] = None):
+        driver = self.checkout(timeout)
+        broken = False
+        try:
+            yield driver
+        except Exception:
+            # Any failure may have left the browser dead or mid-page, so it is not handed out again
+            broken = True
+            raise
+        finally:
+            self.checkin(driver, broken)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_webdriver_pool() -> WebDriverPool:
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = WebDriverPool()
+            atexit.register(_default_pool.close)
+    return _default_pool
+
+
+# Extraction modes: 'bulk' pulls every card in a single execute_script round trip,
+# 'elements' walks the cards with one find_element round trip per field
+EXTRACTION_MODES = ('bulk', 'elements')
+
+_CARD_HELPERS_JS = """
+const text = (root, sel) => { const el = root.querySelector(sel); return el ? el.innerText : null; };
+const prop = (root, sel, name) => { const el = root.querySelector(sel); return el ? el[name] : null; };
+const attr = (root, sel, name) => { const el = root.querySelector(sel); return el ? el.getAttribute(name) : null; };
+"""
+
+GOOGLE_CARDS_JS = _CARD_HELPERS_JS + """
+return Array.from(document.querySelectorAll('.YwonT'), card => ({
+    title: text(card, '.hfac6d'),
+    link: prop(card, '.v1uiFd a', 'href'),
+    image: prop(card, '.v1uiFd img', 'src'),
+    source: text(card, '.KuNgxf'),
+    total_time: text(card, '.wHYlTd'),
+    ingredients: text(card, '.LDr9cf'),
+    ratings: text(card, '.YDIN4c'),
+    reviews: text(card, '.HypWnf'),
+})).slice(arguments[0]);
+"""
+
+BING_CARDS_JS = _CARD_HELPERS_JS + """
+return Array.from(document.querySelectorAll('.wfrGridCell'), card => ({
+    title: text(card, '.rwtitle'),
+    link: attr(card, '.b_responsiveWaterfallItemCard', 'data-prmurl'),
+    image: prop(card, '.rwimage img', 'src'),
+    tags: text(card, '.rwtags'),
+    rating_label: attr(card, '.rwtags .csrc', 'aria-label'),
+})).slice(arguments[0], arguments[1]);
+"""
+
+GOOGLE_CARD_COUNT_JS = "return document.querySelectorAll('.YwonT').length;"
+
+# Cheap counter polled by the waits instead of an XPath find_elements after every scroll
+BING_CARD_COUNT_JS = """return document.querySelectorAll('div.wfrGridCell[role="button"]').length;"""
+
+BING_SCROLL_TO_END_JS = "window.scrollTo(0, document.body.scrollHeight);"
+
+
+def _element_text(root, selector: str) -> Optional[str]:
+    try:
+        return root.find_element(By.CSS_SELECTOR, selector).text
+    except NoSuchElementException:
+        return None
 
-    link = None
 
-    while True:
-        show_more_button = driver.find_element(By.XPATH, '//div[@aria-label="Show more" and @role="button"]')
-        print(show_more_button)  # just for debug
-        # TODO: fix, show more is always there, need another condition
-        time.sleep(1)
-        try:
-            WebDriverWait(driver, 5).until(EC.element_to_be_clickable(show_more_button)).click()
-        except TimeoutException:
-            break
+def _element_attribute(root, selector: str, name: str) -> Optional[str]:
+    try:
+        return root.find_element(By.CSS_SELECTOR, selector).get_attribute(name)
+    except NoSuchElementException:
+        return None
 
-        # if show_more_button element becomes False, break the loop
-        if not show_more_button:
-            break
 
-    for index, result in enumerate(driver.find_elements(By.CSS_SELECTOR, '.YwonT')):
-        try:
-            title = result.find_element(By.CSS_SELECTOR, '.hfac6d').text
-        except NoSuchElementException:
-            title = None
+def _extract_google_cards(driver: webdriver.Firefox, extraction: str, start: int = 0) -> list:
+    # Cards from index `start` on, so streaming callers only pull what loaded since the last batch
+    if extraction == 'bulk':
+        return driver.execute_script(GOOGLE_CARDS_JS, start)
 
-        results_dict['title'].append(title)
+    return [{
+        'title': _element_text(result, '.hfac6d'),
+        'link': _element_attribute(result, '.YwonT .v1uiFd a', 'href'),
+        'image': _element_attribute(result, '.YwonT .v1uiFd img', 'src'),
+        'source': _element_text(result, '.KuNgxf'),
+        'total_time': _element_text(result, '.wHYlTd'),
+        'ingredients': _element_text(result, '.LDr9cf'),
+        'ratings': _element_text(result, '.YDIN4c'),
+        'reviews': _element_text(result, '.HypWnf'),
+    } for result in driver.find_elements(By.CSS_SELECTOR, '.YwonT')[start:]]
 
-        link = result.find_element(By.CSS_SELECTOR, '.YwonT .v1uiFd a').get_attribute('href')
-        results_dict['link'].append(link)
 
-        image = result.find_element(By.CSS_SELECTOR, '.YwonT .v1uiFd img').get_attribute('src')
-        results_dict['image'].append(image)
+def _extract_bing_cards(driver: webdriver.Firefox, extraction: str, limit: int, start: int = 0) -> list:
+    if extraction == 'bulk':
+        return driver.execute_script(BING_CARDS_JS, start, limit)
 
-        source = result.find_element(By.CSS_SELECTOR, '.KuNgxf').text
-        results_dict['source'].append(source)
+    return [{
+        # TODO: Figure out why some titles are cut off
+        'title': _element_text(result, '.rwtitle'),
+        'link': _element_attribute(result, '.wfrGridCell .b_responsiveWaterfallItemCard', 'data-prmurl'),
+        'image': _element_attribute(result, '.rwimage img', 'src'),
+        'tags': _element_text(result, '.rwtags'),
+        'rating_label': _element_attribute(result, '.rwtags .csrc', 'aria-label'),
+    } for result in driver.find_elements(By.CSS_SELECTOR, '.wfrGridCell')[start:limit]]
 
-        try:
-            total_time = result.find_element(By.CSS_SELECTOR, '.wHYlTd').text
-        except NoSuchElementException:
-            total_time = None
 
-        results_dict['total_time'].append(total_time)
+def scrape_recipes_google(ingredients: list, cuisine: str, pool: Optional[WebDriverPool] = None,
+                          extraction: str = 'bulk', wait_policy: Optional[WaitPolicy] = None) -> dict:
+    batches = iter_recipes_google(ingredients, cuisine, pool, extraction, wait_policy)
+    return sr.merge_results(sr.new_google_results(), batches)
 
-        try:
-            # stays the list if need to extract certain ingredient
-            ingredients = result.find_element(By.CSS_SELECTOR, '.LDr9cf').text.split(',')
-        except NoSuchElementException:
-            ingredients = None
 
-        results_dict['ingredients'].append(ingredients)
+def iter_recipes_google(ingredients: list, cuisine: str, pool: Optional[WebDriverPool] = None,
+                        extraction: str = 'bulk', wait_policy: Optional[WaitPolicy] = None) -> Iterator[dict]:
+    # Yields results_dict batches as cards load, the browser goes back to the pool when the generator ends
+    with (pool or get_webdriver_pool()).driver() as driver:
+        yield from _iter_google(driver, ingredients, cuisine, extraction, wait_policy)
 
-        try:
-            ratings = result.find_element(By.CSS_SELECTOR, '.YDIN4c').text
-        except NoSuchElementException:
-            ratings = None
 
-        results_dict['ratings'].append(ratings)
+def _iter_google(driver: webdriver.Firefox, ingredients: list, cuisine: str, extraction: str = 'bulk',
+                 wait_policy: Optional[WaitPolicy] = None) -> Iterator[dict]:
+    policy = wait_policy or WaitPolicy()
 
-        try:
-            reviews = result.find_element(By.CSS_SELECTOR, '.HypWnf').text.replace('(', '').replace(')', '')
-        except NoSuchElementException:
-            reviews = None
+    driver.get(sr.google_search_url(ingredients, cuisine))
 
-        results_dict['reviews'].append(reviews)
+    policy.until_present(driver, '.YwonT', 'results')
+    count = policy.until_count_stable(driver, GOOGLE_CARD_COUNT_JS, 'results')
+    emitted = 0
 
-        # print(f'{index + 1}\n{title}\n{link}\n{source}\n{total_time}\n{ingredients}\n{rating}\n{reviews}\n')
+    while True:
+        cards = _extract_google_cards(driver, extraction, emitted)
+        if cards:
+            emitted += len(cards)
+            telemetry.count('cards_extracted', len(cards), engine='google', path='browser')
+            yield sr.google_results_from_cards(cards)
+
+        show_more_button = policy.until_clickable(driver, By.XPATH,
+                                                  '//div[@aria-label="Show more" and @role="button"]', 'show_more')
+        if show_more_button is None:
+            break
+        show_more_button.click()
 
-    driver.quit()
+        # Show more stays on the page once everything is expanded, so stop when clicking it adds no cards
+        new_count = policy.until_count_above(driver, GOOGLE_CARD_COUNT_JS, count, 'show_more')
+        if new_count == count:
+            break
+        count = new_count
 
-    return results_dict
 
+def scrape_recipes_bing(ingredients: list, cuisine: str, limit: int, pool: Optional[WebDriverPool] = None,
+                        extraction: str = 'bulk', wait_policy: Optional[WaitPolicy] = None) -> dict:
+    batches = iter_recipes_bing(ingredients, cuisine, limit, pool, extraction, wait_policy)
+    return sr.merge_results(sr.new_bing_results(), batches)
 
-def scrape_recipes_bing(ingredients: list, cuisine: str, limit: int) -> dict:
 
-    driver = setup_webdriver()
+def iter_recipes_bing(ingredients: list, cuisine: str, limit: int, pool: Optional[WebDriverPool] = None,
+                      extraction: str = 'bulk', wait_policy: Optional[WaitPolicy] = None) -> Iterator[dict]:
+    with (pool or get_webdriver_pool()).driver() as driver:
+        yield from _iter_bing(driver, ingredients, cuisine, limit, extraction, wait_policy)
 
-    ingredients_str = '+'.join(ingredients)
-    if cuisine == 'Any':
-        driver.get(f'https://www.bing.com/search?q={ingredients_str}+vegetarian+recipe&hl=en-US')
-    else:
-        driver.get(f'https://www.bing.com/search?q={ingredients_str}+{cuisine}+vegetarian+recipe&hl=en-US')
 
-    time.sleep(5)
+def _iter_bing(driver: webdriver.Firefox, ingredients: list, cuisine: str, limit: int,
+               extraction: str = 'bulk', wait_policy: Optional[WaitPolicy] = None) -> Iterator[dict]:
+    policy = wait_policy or WaitPolicy()
 
-    results_dict = {
-        'title': [],
-        'link': [],
-        'image': [],
-        'source': [],
-        'total_time': [],
-        'calories': [],
-        'servings': [],
-        'ratings': [],
-        'reviews': []
-    }
+    driver.get(sr.bing_search_url(ingredients, cuisine))
+
+    policy.until_network_idle(driver)
 
     # On FF, Bing throws up banner to add Bing extension to browser, we need to find it and click 'Maybe Later'
     try:
         maybe_later_text = driver.find_element(By.XPATH, '//span[@id="bnp_hfly_cta2"]')
         WebDriverWait(driver, 5).until(EC.element_to_be_clickable(maybe_later_text)).click()
     except NoSuchElementException:
-        print("Banner not found, skipping...")
-
-    see_more_button = driver.find_element(By.XPATH, '//a[@title="See more" and @role="button"]')
-    print(see_more_button)  # just for debug
-    WebDriverWait(driver, 5).until(EC.element_to_be_clickable(see_more_button)).click()
-
-    reached_end = False
-    max_retries = 10
-    old_count = len(driver.find_elements(By.XPATH, '//div[@class="wfrGridCell" and @role="button"]'))
-
-    def scroll_and_find():
-        driver.execute_script('window.scrollBy(0,250)')  # scroll by 20 on each iteration
-        time.sleep(0.5)
-        count = len(driver.find_elements(By.XPATH, '//div[@class="wfrGridCell" and @role="button"]'))
-
-        return count
-
-    while not reached_end:
-        #driver.find_element(By.CSS_SELECTOR, "body").send_keys(Keys.END)
-        new_count = scroll_and_find()
-        print(new_count)
-        if new_count > limit:
+        telemetry.event('bing_banner_missing')
+
+    # The first page of cards is already there, hand it out before expanding the grid
+    cards = _extract_bing_cards(driver, extraction, limit)
+    emitted = len(cards)
+    if cards:
+        telemetry.count('cards_extracted', len(cards), engine='bing', path='browser')
+        yield sr.bing_results_from_cards(cards)
+
+    see_more_button = policy.until_clickable(driver, By.XPATH, '//a[@title="See more" and @role="button"]',
+                                             'show_more')
+    if see_more_button is not None:
+        see_more_button.click()
+
+    old_count = policy.until_count_stable(driver, BING_CARD_COUNT_JS, 'results')
+
+    # Scroll to the end and wait for the grid to grow, the grid is exhausted once a scroll adds nothing
+    while emitted < limit:
+        cards = _extract_bing_cards(driver, extraction, limit, emitted)
+        if cards:
+            emitted += len(cards)
+            telemetry.count('cards_extracted', len(cards), engine='bing', path='browser')
+            yield sr.bing_results_from_cards(cards)
+        if emitted >= limit:
             break
 
+        driver.execute_script(BING_SCROLL_TO_END_JS)
+        telemetry.count('bing_scrolls')
+        new_count = policy.until_count_above(driver, BING_CARD_COUNT_JS, old_count, 'scroll')
         if new_count == old_count:
-            # Make sure there's really no new elements
-            for i in range(max_retries):
-                new_count = scroll_and_find()
-                if new_count == old_count and i == max_retries-1:
-                    reached_end = True
-                    break
-        else:
-            old_count = new_count
-
-    for index, result in enumerate(driver.find_elements(By.CSS_SELECTOR, '.wfrGridCell')):
-        try:
-            # TODO: Figure out why some titles are cut off
-            title = result.find_element(By.CSS_SELECTOR, '.rwtitle').text
-            # title = result.find_element(By.XPATH, "//div[@class='rwtitle']//strong").text
-        except NoSuchElementException:
-            title = None
-        results_dict['title'].append(title)
-
-        try:
-            link = result.find_element(By.CSS_SELECTOR,
-                                       '.wfrGridCell .b_responsiveWaterfallItemCard'
-                                       ).get_attribute('data-prmurl')
-        except NoSuchElementException:
-            link = None
-        results_dict['link'].append(link)
-
-        try:
-            image = result.find_element(By.CSS_SELECTOR, '.rwimage img').get_attribute('src')
-        except NoSuchElementException:
-            image = None
-        results_dict['image'].append(image)
-
-        try:
-            tags = result.find_element(By.CSS_SELECTOR, '.rwtags').text.split('\n')
-        except NoSuchElementException:
-            tags = None
-
-        tags_len = len(tags)
-        source = tags[0] if tags_len > 0 else None
-        reviews = tags[1] if tags_len > 1 and 'reviews' in tags[1] else None
-
-        results_dict['source'].append(source)
-        results_dict['reviews'].append(reviews)
-
-        total_time = calories = servings = None
-        if tags_len > 1:
-            for elem in tags[-1].split('·'):
-                if 'min' in elem:
-                    total_time = elem.strip()
-                if 'cals' in elem:
-                    calories = elem.strip()
-                if 'servs' in elem:
-                    servings = elem.strip()
-
-        results_dict['total_time'].append(total_time)
-        results_dict['calories'].append(calories)
-        results_dict['servings'].append(servings)
-
-        try:
-            # Displays as "Star Rating: 4.5 out of 5"
-            ratings = result.find_element(By.CSS_SELECTOR, '.rwtags .csrc').get_attribute('aria-label').split()[2]
-        except NoSuchElementException:
-            ratings = None
-
-        results_dict['ratings'].append(ratings)
-
-        if index+1 == limit:
-            break
-
-       # print(f'{index + 1}\n{title}\n{link}\n{source}\n{reviews}\n{total_time}\n{calories}\n{servings}\n{rating}\n')
-
-    # driver.quit()
-
-    return results_dict
+            # No growth within the scroll timeout, which a slow grid looks like too. Scroll once more and require
+            # the count to settle: only a settled, unchanged count means the grid ran out of results
+            driver.execute_script(BING_SCROLL_TO_END_JS)
+            new_count = policy.until_count_stable(driver, BING_CARD_COUNT_JS, 'grid_end')
+            if new_count <= old_count:
+                policy.exhausted = policy.timings[-1]['satisfied']
+                break
+        old_count = new_count
 
 
 if __name__ == '__main__':
     pass
     # test_app()
-
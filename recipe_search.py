@@ -0,0 +1,141 @@
+import queue
+import threading
+
+import search_results as sr
+import telemetry
+
+# Everything needed to run a search outside the Streamlit script, so background workers can import it.
+# The scraper modules are imported on first search, so the app can use ResultCollector without loading them
+
+
+def _unseen_rows(batch: dict, seen: set, max_rows: int) -> dict:
+    # Keeps up to max_rows rows whose canonical link is not in seen, and adds those links to seen
+    keep = []
+    for i, link in enumerate(batch['link']):
+        if len(keep) >= max_rows:
+            break
+        key = sr.canonical_link(link)
+        if key not in seen:
+            seen.add(key)
+            keep.append(i)
+    return {column: [values[i] for i in keep] for column, values in batch.items()}
+
+
+def iter_engine_batches(engine_opt, ingredients, cuisine_opt, limit_opt, exhausted=None):
+    # Try the browser-free HTTP engine first and only launch selenium when it comes back short.
+    # exhausted, when given, gets engine_opt added if the engine ran out of results before the limit
+    import requests
+    import http_scraper
+
+    recipe_dict = None
+    try:
+        if engine_opt == 'Google':
+            recipe_dict = http_scraper.scrape_recipes_google(ingredients, cuisine_opt)
+            needs_browser = not recipe_dict['link']
+        else:
+            recipe_dict = http_scraper.scrape_recipes_bing(ingredients, cuisine_opt, limit_opt)
+            needs_browser = len(recipe_dict['link']) < limit_opt
+    except requests.RequestException:
+        needs_browser = True
+
+    # Whatever HTTP found goes out first, the browser only has to fill in the rest
+    sent = recipe_dict['link'] if recipe_dict is not None else []
+    seen = {sr.canonical_link(link) for link in sent}
+    if sent:
+        yield recipe_dict
+    if not needs_browser:
+        return
+
+    import recipe_scraper as scraper
+    from wait_policy import WaitPolicy
+
+    telemetry.count('browser_fallbacks', engine=engine_opt)
+    if engine_opt == 'Google':
+        yield from scraper.iter_recipes_google(ingredients, cuisine_opt)
+        return
+
+    # The browser grid starts from the top again, so ask for enough cards to cover the ones already sent
+    missing = limit_opt - len(sent)
+    policy = WaitPolicy()
+    for batch in scraper.iter_recipes_bing(ingredients, cuisine_opt, limit_opt + len(sent), wait_policy=policy):
+        batch = _unseen_rows(batch, seen, missing)
+        if batch['link']:
+            missing -= len(batch['link'])
+            yield batch
+        if missing <= 0:
+            break
+    else:
+        # The grid was seen to settle short of the limit, a larger limit would not find more.
+        # Not when a wait merely timed out, those results are only cut short
+        if exhausted is not None and policy.exhausted:
+            exhausted.add(engine_opt)
+
+
+def iter_concurrently(named_iterators, failed=None):
+    # Drains every iterator on its own thread and yields (name, item) as soon as any of them produces one,
+    # so total latency is the slowest iterator rather than the sum. A failing iterator only drops its own items,
+    # and its name is added to failed when given
+    results = queue.Queue()
+    finished = object()
+
+    def drain(name, iterator):
+        try:
+            for item in iterator:
+                results.put((name, item))
+        except Exception as e:
+            telemetry.event('scrape_failed', engine=name, error=repr(e))
+            if failed is not None:
+                failed.add(name)
+        finally:
+            results.put((name, finished))
+
+    for name, iterator in named_iterators:
+        threading.Thread(target=drain, args=(name, iterator), daemon=True).start()
+
+    remaining = len(named_iterators)
+    while remaining:
+        name, item = results.get()
+        if item is finished:
+            remaining -= 1
+        else:
+            yield name, item
+
+
+def iter_scrape_batches(query, exhausted=None, failed=None):
+    # Yields (engine, results_dict batch), the 'All' mode runs both engines at once on separate pooled browsers.
+    # exhausted, when given, collects the engines that ran out of results before the limit, and failed the
+    # engines an 'All' search went on without
+    ingredients, cuisine_opt, engine_opt, limit_opt = query
+    ingredients = list(ingredients)
+
+    if engine_opt != 'All':
+        for batch in iter_engine_batches(engine_opt, ingredients, cuisine_opt, limit_opt, exhausted):
+            yield engine_opt, batch
+        return
+
+    yield from iter_concurrently([
+        ('Google', iter_engine_batches('Google', ingredients, cuisine_opt, limit_opt, exhausted)),
+        ('Bing', iter_engine_batches('Bing', ingredients, cuisine_opt, limit_opt, exhausted)),
+    ], failed)
+
+
+class ResultCollector:
+    """Accumulates (engine, batch) pairs into the results_dict the app renders for the selected engine option."""
+
+    def __init__(self, engine_opt: str):
+        self.merger = sr.ResultMerger() if engine_opt == 'All' else None
+        if self.merger is not None:
+            self.results = self.merger.results
+        elif engine_opt == 'Google':
+            self.results = sr.new_google_results()
+        else:
+            self.results = sr.new_bing_results()
+
+    def add(self, engine: str, batch: dict):
+        if self.merger is not None:
+            self.merger.add(batch, engine)
+        else:
+            sr.merge_results(self.results, [batch])
+
+    def __len__(self):
+        return len(self.results['link'])
@@ -0,0 +1,92 @@
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Optional
+from urllib.parse import urlsplit
+import random
+import threading
+import time
+
+import recipe_parser as parser
+import telemetry
+import recipe_fetcher as fetcher
+
+
+class HostFailureTracker:
+    """Remembers which recipe sites keep failing to parse, so they are not picked again."""
+
+    def __init__(self, min_attempts: int = 3, max_failure_rate: float = 0.8):
+        self.min_attempts = min_attempts
+        self.max_failure_rate = max_failure_rate
+        self._lock = threading.Lock()
+        self._attempts = defaultdict(int)
+        self._failures = defaultdict(int)
+
+    def record(self, url: str, success: bool):
+        host = urlsplit(url).netloc
+        with self._lock:
+            self._attempts[host] += 1
+            if not success:
+                self._failures[host] += 1
+
+    def should_skip(self, url: str) -> bool:
+        host = urlsplit(url).netloc
+        with self._lock:
+            attempts = self._attempts[host]
+            return attempts >= self.min_attempts and self._failures[host] / attempts >= self.max_failure_rate
+
+
+_default_tracker = HostFailureTracker()
+
+
+def fetch_recipe_item(url: str) -> Optional[parser.RecipeItem]:
+    json_ld = fetcher.get_recipe_json(url)
+    if not json_ld:
+        return None
+    recipe_item = parser.RecipeItem(json_ld)
+    return recipe_item if recipe_item.fill_values() else None
+
+
+@telemetry.timed('select_recipe')
+def select_recipe(urls: list, k: int = 4, deadline: float = 15.0,
+                  tracker: Optional[HostFailureTracker] = None,
+                  rng: Optional[random.Random] = None) -> Optional[parser.RecipeItem]:
+    # Race K random candidates at a time, return the first that parses and give up at the deadline
+    tracker = tracker or _default_tracker
+    candidates = [url for url in dict.fromkeys(urls) if url and not tracker.should_skip(url)]
+    (rng or random).shuffle(candidates)
+    candidates = iter(candidates)
+
+    end = time.monotonic() + deadline
+    executor = ThreadPoolExecutor(max_workers=k)
+    futures = {}
+
+    def submit_next():
+        url = next(candidates, None)
+        if url is not None:
+            futures[executor.submit(fetch_recipe_item, url)] = url
+
+    try:
+        for _ in range(k):
+            submit_next()
+
+        pending = set(futures)
+        while pending:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                url = futures.pop(future)
+                try:
+                    recipe_item = future.result()
+                except Exception:
+                    recipe_item = None
+                tracker.record(url, recipe_item is not None)
+                if recipe_item is not None:
+                    return recipe_item
+                submit_next()
+            pending = set(futures)
+        return None
+    finally:
+        # Requests already in flight finish in the background, bounded by the request timeout
+        executor.shutdown(wait=False, cancel_futures=True)
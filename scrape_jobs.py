@@ -0,0 +1,200 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Optional
+import multiprocessing
+import threading
+import time
+import uuid
+
+import recipe_index as ri
+import recipe_search
+import search_cache as sc
+import telemetry
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+
+class JobQueueFull(Exception):
+    """Raised when max_pending scrape jobs are already queued or running."""
+
+
+# Worker side end of the progress channel, set by the pool initializer
+_updates = None
+
+
+def _init_worker(updates):
+    global _updates
+    _updates = updates
+
+
+def run_scrape_job(job_id: str, query: tuple):
+    # Runs in a worker process, every batch is sent back as soon as it is scraped
+    _updates.put((job_id, RUNNING, None, None))
+    exhausted, failed = set(), set()
+    try:
+        with telemetry.span('scrape_job', engine=query[2]):
+            for engine, batch in recipe_search.iter_scrape_batches(query, exhausted, failed):
+                telemetry.count('cards', len(batch['link']), engine=engine)
+                _updates.put((job_id, 'batch', engine, batch))
+    except Exception as e:
+        _updates.put((job_id, FAILED, None, repr(e)))
+        return
+    # Only Bing takes a limit, so only its running out lets these results stand in for a larger limit
+    _updates.put((job_id, DONE, None, {'exhausted': 'Bing' in exhausted, 'failed_engines': sorted(failed)}))
+
+
+@dataclass
+class ScrapeJob:
+    id: str
+    query: tuple
+    collector: recipe_search.ResultCollector = field(repr=False)
+    status: str = QUEUED
+    error: Optional[str] = None
+    exhausted: bool = False
+    # Engines an 'All' search finished without, their results are missing
+    failed_engines: list = field(default_factory=list)
+    submitted_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+
+class ScrapeJobQueue:
+    """Runs scrapes on a worker process pool, decoupled from Streamlit reruns; identical queries share one job."""
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 16, retain_seconds: float = 600):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retain_seconds = retain_seconds
+
+        # spawn, since forking a process that already runs threads (streamlit, the collector) is not safe
+        ctx = multiprocessing.get_context('spawn')
+        self._updates = ctx.Queue()
+        self._executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx,
+                                             initializer=_init_worker, initargs=(self._updates,))
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._inflight = {}
+        threading.Thread(target=self._collect, name='scrape-job-collector', daemon=True).start()
+
+    def submit(self, query: tuple) -> ScrapeJob:
+        with self._lock:
+            self._expire()
+            job_id = self._inflight.get(query)
+            if job_id is not None:
+                return self._jobs[job_id]
+            if len(self._inflight) >= self.max_pending:
+                telemetry.count('scrape_jobs_rejected')
+                raise JobQueueFull(f'{len(self._inflight)} scrape jobs already pending')
+
+            job = ScrapeJob(uuid.uuid4().hex, query, recipe_search.ResultCollector(query[2]))
+            self._jobs[job.id] = job
+            self._inflight[query] = job.id
+
+        future = self._executor.submit(run_scrape_job, job.id, query)
+        future.add_done_callback(partial(self._on_future_done, job.id))
+        return job
+
+    def get(self, job_id: str) -> Optional[ScrapeJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def snapshot(self, job_id: str) -> Optional[dict]:
+        # Copy under the lock, the collector thread keeps appending to the live lists
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {
+                'status': job.status,
+                'error': job.error,
+                'failed_engines': list(job.failed_engines),
+                'results': {column: list(values) for column, values in job.collector.results.items()},
+            }
+
+    def stats(self) -> dict:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in (QUEUED, RUNNING, DONE, FAILED)}
+
+    def _finish(self, job: ScrapeJob, status: str, error: Optional[str] = None):
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        self._inflight.pop(job.query, None)
+        # Submit to finish, so time spent queued behind other jobs shows up too
+        telemetry.observe('scrape_job_latency', job.finished_at - job.submitted_at, status=status)
+
+    def _expire(self):
+        cutoff = time.time() - self.retain_seconds
+        for job_id in [j.id for j in self._jobs.values() if j.finished and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _collect(self):
+        # One bad update fails its job, never this thread, or every later job would stay RUNNING and be polled forever
+        while True:
+            job_id = None
+            try:
+                job_id, kind, engine, payload = self._updates.get()
+                self._handle_update(job_id, kind, engine, payload)
+            except Exception as e:
+                telemetry.event('scrape_job_collect_failed', job_id=job_id, error=repr(e))
+                with self._lock:
+                    job = self._jobs.get(job_id)
+                    if job is not None and not job.finished:
+                        self._finish(job, FAILED, repr(e))
+
+    def _handle_update(self, job_id: str, kind: str, engine: Optional[str], payload):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return
+            if kind == 'batch':
+                job.collector.add(engine, payload)
+            elif kind == RUNNING:
+                job.status = RUNNING
+            elif kind == DONE:
+                job.exhausted = payload['exhausted']
+                job.failed_engines = payload['failed_engines']
+                self._finish(job, DONE)
+            else:
+                self._finish(job, kind, payload)
+            results = job.collector.results if kind == DONE else None
+
+        # Partial results from a search that lost an engine are shown, but not kept for other sessions
+        if results is not None and results['link'] and not job.failed_engines:
+            self._store_results(job.query, results, job.exhausted)
+
+    def _store_results(self, query: tuple, results: dict, exhausted: bool):
+        # The job is already DONE, a failed write only costs a later cache hit
+        ingredients, cuisine_opt, engine_opt, limit_opt = query
+        search_cache = sc.get_search_cache()
+        if search_cache is not None:
+            try:
+                search_cache.put(list(ingredients), cuisine_opt, engine_opt, limit_opt, results, exhausted)
+            except Exception as e:
+                telemetry.event('search_cache_write_failed', error=repr(e))
+        # Also indexed per ingredient, so later queries with other combinations can be answered locally
+        recipe_index = ri.get_recipe_index()
+        if recipe_index is not None:
+            try:
+                with telemetry.span('recipe_index', op='add'):
+                    recipe_index.add(list(ingredients), cuisine_opt, engine_opt, results)
+            except Exception as e:
+                telemetry.event('recipe_index_write_failed', error=repr(e))
+
+    def _on_future_done(self, job_id: str, future):
+        # Only matters when a worker died without reporting back, e.g. a broken process pool
+        exc = future.exception()
+        if exc is None:
+            return
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and not job.finished:
+                self._finish(job, FAILED, repr(exc))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
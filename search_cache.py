@@ -0,0 +1,100 @@
+from typing import Optional
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import search_results as sr
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'producerecipe', 'searches.sqlite')
+
+
+def normalize_query(ingredients: list, cuisine: str, engine: str, limit: Optional[int]) -> tuple:
+    # Same produce in any order or with duplicates is the same search
+    return ','.join(sorted(set(i.strip().lower() for i in ingredients))), cuisine.lower(), engine.lower(), limit or 0
+
+
+class SearchCache:
+    """Search results keyed on the normalized query, in a SQLite file that app replicas on one host can share."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: float = 6 * 3600):
+        self.path = path
+        self.ttl = ttl
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        # Generous busy timeout since several replicas may write to the same file
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS searches (
+                ingredients TEXT NOT NULL,
+                cuisine TEXT NOT NULL,
+                engine TEXT NOT NULL,
+                result_limit INTEGER NOT NULL,
+                n_results INTEGER NOT NULL,
+                results TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                exhausted INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (ingredients, cuisine, engine, result_limit)
+            )""")
+        # Files written before the exhausted column existed, their rows default to not exhausted
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(searches)')}
+        if 'exhausted' not in columns:
+            self._conn.execute('ALTER TABLE searches ADD COLUMN exhausted INTEGER NOT NULL DEFAULT 0')
+
+    def get(self, ingredients: list, cuisine: str, engine: str, limit: Optional[int] = None) -> Optional[dict]:
+        key = normalize_query(ingredients, cuisine, engine, limit)
+        # A search stored with a larger limit covers this one. A short result set only does when the engine really
+        # ran out of results, not when a timeout or deduplication cut it short
+        with self._lock:
+            row = self._conn.execute("""
+                SELECT results FROM searches
+                WHERE ingredients = ? AND cuisine = ? AND engine = ? AND created_at >= ?
+                  AND (result_limit >= ? OR exhausted)
+                ORDER BY result_limit LIMIT 1""",
+                (*key[:3], time.time() - self.ttl, key[3])).fetchone()
+        if row is None:
+            return None
+
+        results = json.loads(row[0])
+        if limit:
+            results = sr.limit_results(results, limit)
+        return results
+
+    def put(self, ingredients: list, cuisine: str, engine: str, limit: Optional[int], results: dict,
+            exhausted: bool = False):
+        key = normalize_query(ingredients, cuisine, engine, limit)
+        n_results = len(results.get('link', []))
+        with self._lock:
+            self._conn.execute("""
+                INSERT OR REPLACE INTO searches
+                    (ingredients, cuisine, engine, result_limit, n_results, results, created_at, exhausted)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (*key, n_results, json.dumps(results), time.time(), int(exhausted)))
+
+    def purge_expired(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM searches WHERE created_at < ?', (time.time() - self.ttl,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> Optional[SearchCache]:
+    # PRODUCERECIPE_SEARCH_CACHE= (empty) turns the cache off
+    global _default_cache
+    path = os.environ.get('PRODUCERECIPE_SEARCH_CACHE', DEFAULT_CACHE_PATH)
+    if not path:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = SearchCache(path, ttl=float(os.environ.get('PRODUCERECIPE_SEARCH_CACHE_TTL', 6 * 3600)))
+    return _default_cache
@@ -0,0 +1,180 @@
+from urllib.parse import parse_qsl, quote_plus, urlencode, urlsplit, urlunsplit
+import os
+import re
+
+# Shared by the selenium and plain HTTP engines, neither the schema nor the card parsing depends on a browser
+
+# Overridable so the scrapers can be pointed at the local replay server (benchmarks/replay_server.py)
+GOOGLE_SEARCH_URL = os.environ.get('PRODUCERECIPE_GOOGLE_SEARCH_URL', 'https://www.google.com/search')
+BING_SEARCH_URL = os.environ.get('PRODUCERECIPE_BING_SEARCH_URL', 'https://www.bing.com/search')
+
+# Union of the Google and Bing schemas, plus which engine found the recipe first
+UNIFIED_COLUMNS = ['title', 'link', 'image', 'source', 'total_time', 'ingredients', 'calories', 'servings',
+                   'ratings', 'reviews', 'engine']
+
+TRACKING_PARAM_RE = re.compile(r'^(utm_\w+|fbclid|gclid|msclkid|ref)$', re.IGNORECASE)
+
+
+def _query(ingredients: list, cuisine: str) -> str:
+    terms = list(ingredients)
+    if cuisine != 'Any':
+        terms.append(cuisine)
+    terms += ['vegetarian', 'recipe']
+    return '+'.join(quote_plus(term) for term in terms)
+
+
+def google_search_url(ingredients: list, cuisine: str) -> str:
+    return f'{GOOGLE_SEARCH_URL}?q={_query(ingredients, cuisine)}&hl=en-US'
+
+
+def bing_search_url(ingredients: list, cuisine: str) -> str:
+    return f'{BING_SEARCH_URL}?q={_query(ingredients, cuisine)}&hl=en-US'
+
+
+def new_google_results() -> dict:
+    return {
+        'title': [],
+        'link': [],
+        'image': [],
+        'source': [],
+        'total_time': [],
+        'ingredients': [],
+        'ratings': [],
+        'reviews': []
+    }
+
+
+def new_bing_results() -> dict:
+    return {
+        'title': [],
+        'link': [],
+        'image': [],
+        'source': [],
+        'total_time': [],
+        'calories': [],
+        'servings': [],
+        'ratings': [],
+        'reviews': []
+    }
+
+
+def add_google_card(results_dict: dict, card: dict):
+    results_dict['title'].append(card['title'])
+    results_dict['link'].append(card['link'])
+    results_dict['image'].append(card['image'])
+    results_dict['source'].append(card['source'])
+    results_dict['total_time'].append(card['total_time'])
+    # stays the list if need to extract certain ingredient
+    results_dict['ingredients'].append(card['ingredients'].split(',') if card['ingredients'] is not None else None)
+    results_dict['ratings'].append(card['ratings'])
+    reviews = card['reviews']
+    results_dict['reviews'].append(reviews.replace('(', '').replace(')', '') if reviews is not None else None)
+
+
+def add_bing_card(results_dict: dict, card: dict):
+    results_dict['title'].append(card['title'])
+    results_dict['link'].append(card['link'])
+    results_dict['image'].append(card['image'])
+
+    tags = card['tags'].split('\n') if card['tags'] else []
+    tags_len = len(tags)
+    source = tags[0] if tags_len > 0 else None
+    reviews = tags[1] if tags_len > 1 and 'reviews' in tags[1] else None
+
+    results_dict['source'].append(source)
+    results_dict['reviews'].append(reviews)
+
+    total_time = calories = servings = None
+    if tags_len > 1:
+        for elem in tags[-1].split('·'):
+            if 'min' in elem:
+                total_time = elem.strip()
+            if 'cals' in elem:
+                calories = elem.strip()
+            if 'servs' in elem:
+                servings = elem.strip()
+
+    results_dict['total_time'].append(total_time)
+    results_dict['calories'].append(calories)
+    results_dict['servings'].append(servings)
+
+    # Displays as "Star Rating: 4.5 out of 5"
+    rating_label = (card['rating_label'] or '').split()
+    results_dict['ratings'].append(rating_label[2] if len(rating_label) > 2 else None)
+
+
+def google_results_from_cards(cards: list) -> dict:
+    results_dict = new_google_results()
+    for card in cards:
+        add_google_card(results_dict, card)
+    return results_dict
+
+
+def bing_results_from_cards(cards: list) -> dict:
+    results_dict = new_bing_results()
+    for card in cards:
+        add_bing_card(results_dict, card)
+    return results_dict
+
+
+def merge_results(results_dict: dict, batches) -> dict:
+    # Appends every results_dict batch column-wise onto results_dict, in place
+    for batch in batches:
+        for column, values in batch.items():
+            results_dict.setdefault(column, []).extend(values)
+    return results_dict
+
+
+def limit_results(results_dict: dict, limit: int) -> dict:
+    # The limit is Bing's. Merged 'All' results hold every Google row plus Bing's share, so only Bing rows are capped
+    if 'engine' not in results_dict:
+        return {column: values[:limit] for column, values in results_dict.items()}
+
+    keep, n_bing = [], 0
+    for i, engine in enumerate(results_dict['engine']):
+        if engine == 'Google':
+            keep.append(i)
+        elif n_bing < limit:
+            keep.append(i)
+            n_bing += 1
+    return {column: [values[i] for i in keep] for column, values in results_dict.items()}
+
+
+def canonical_link(link: str) -> str:
+    # Same recipe page regardless of scheme, www., trailing slash, fragment or tracking parameters
+    if not link:
+        return None
+    parts = urlsplit(link.strip())
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                       if not TRACKING_PARAM_RE.match(k)])
+    return urlunsplit(('https', host, parts.path.rstrip('/') or '/', query, ''))
+
+
+class ResultMerger:
+    """Merges results_dict batches from several engines into the unified schema, deduplicated by canonical link."""
+
+    def __init__(self):
+        self.results = {column: [] for column in UNIFIED_COLUMNS}
+        self._rows = {}
+
+    def add(self, batch: dict, engine: str):
+        for i in range(len(batch.get('link', []))):
+            key = canonical_link(batch['link'][i])
+
+            if key is not None and key in self._rows:
+                # Seen from the other engine, only fill in what it did not have (e.g. Bing calories on a Google row)
+                row = self._rows[key]
+                for column, values in batch.items():
+                    if column in self.results and self.results[column][row] is None:
+                        self.results[column][row] = values[i]
+                continue
+
+            if key is not None:
+                self._rows[key] = len(self.results['link'])
+            for column in UNIFIED_COLUMNS:
+                values = batch.get(column)
+                self.results[column].append(values[i] if values is not None else None)
+            self.results['engine'][-1] = engine
@@ -0,0 +1,232 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+
+# Per-stage timings, counters and events for the classify -> scrape -> parse -> render pipeline.
+# Everything is aggregated in memory; PRODUCERECIPE_METRICS_DIR adds a Prometheus textfile per process
+# (for node_exporter's textfile collector) and PRODUCERECIPE_TRACE_FILE a JSON-lines log of spans and events.
+
+METRIC_PREFIX = 'producerecipe'
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+class Metrics:
+    """Thread-safe counters and duration histograms, rendered in the Prometheus text exposition format."""
+
+    def __init__(self, buckets: tuple = DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def count(self, name: str, value: float = 1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, _label_key(labels))
+        idx = bisect_left(self.buckets, seconds)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                # Per-bucket counts, plus the +Inf bucket; made cumulative only when rendered
+                hist = self._histograms[key] = {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            hist['buckets'][idx] += 1
+            hist['sum'] += seconds
+            hist['count'] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'counters': {f'{name}{_format_labels(labels)}': value
+                             for (name, labels), value in self._counters.items()},
+                'histograms': {f'{name}{_format_labels(labels)}': {'sum': h['sum'], 'count': h['count']}
+                               for (name, labels), h in self._histograms.items()},
+            }
+
+    def render(self, **extra_labels) -> str:
+        extra = _label_key(extra_labels)
+        lines, typed = [], set()
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, dict(h, buckets=list(h['buckets']))) for key, h in self._histograms.items())
+
+        for (name, labels), value in counters:
+            metric = f'{METRIC_PREFIX}_{name}_total'
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric}{_format_labels(labels + extra)} {value}')
+
+        for (name, labels), hist in histograms:
+            metric = f'{METRIC_PREFIX}_{name}_seconds'
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f'# TYPE {metric} histogram')
+            cumulative = 0
+            for bound, n in zip([*map(str, self.buckets), '+Inf'], hist['buckets']):
+                cumulative += n
+                lines.append(f'{metric}_bucket{_format_labels(labels + extra + (("le", bound),))} {cumulative}')
+            lines.append(f'{metric}_sum{_format_labels(labels + extra)} {hist["sum"]}')
+            lines.append(f'{metric}_count{_format_labels(labels + extra)} {hist["count"]}')
+
+        return '\n'.join(lines) + '\n'
+
+
+class TraceSink:
+    """Appends one JSON object per line; every process opens the file in append mode, so lines do not interleave."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', buffering=1)
+
+    def write(self, record: dict):
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class TextfileExporter:
+    """Rewrites this process's .prom file every `interval` seconds, atomically so the collector never reads half."""
+
+    def __init__(self, metrics: Metrics, directory: str, interval: float = 15):
+        self.metrics = metrics
+        self.interval = interval
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f'{METRIC_PREFIX}_{os.getpid()}.prom')
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        # pid label, so the same series from several worker processes do not collide in the collector
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.metrics.render(pid=os.getpid()))
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+
+metrics = Metrics()
+_trace_sink = None
+_exporter = None
+_setup_lock = threading.Lock()
+_setup_done = False
+_current_span = ContextVar('telemetry_span', default=None)
+
+
+def _setup():
+    # Sinks are created on first use rather than at import, so importing this module never touches the disk
+    global _trace_sink, _exporter, _setup_done
+    with _setup_lock:
+        if _setup_done:
+            return
+        trace_file = os.environ.get('PRODUCERECIPE_TRACE_FILE')
+        if trace_file:
+            _trace_sink = TraceSink(trace_file)
+            atexit.register(_trace_sink.close)
+        metrics_dir = os.environ.get('PRODUCERECIPE_METRICS_DIR')
+        if metrics_dir:
+            _exporter = TextfileExporter(metrics, metrics_dir,
+                                         float(os.environ.get('PRODUCERECIPE_METRICS_INTERVAL', 15)))
+            atexit.register(_exporter.close)
+        _setup_done = True
+
+
+def _emit(record: dict):
+    if not _setup_done:
+        _setup()
+    if _trace_sink is not None:
+        record.update(ts=time.time(), pid=os.getpid())
+        _trace_sink.write(record)
+
+
+def count(name: str, value: float = 1, **labels):
+    if not _setup_done:
+        _setup()
+    metrics.count(name, value, **labels)
+
+
+def observe(name: str, seconds: float, **labels):
+    if not _setup_done:
+        _setup()
+    metrics.observe(name, seconds, **labels)
+
+
+def event(name: str, **fields):
+    # Replaces ad-hoc prints: counted, and written to the trace file with whatever span is active
+    metrics.count('events', event=name)
+    parent = _current_span.get()
+    _emit({'type': 'event', 'name': name, 'trace_id': parent and parent[0], 'span_id': parent and parent[1],
+           **fields})
+
+
+@contextmanager
+def span(stage: str, **labels):
+    """Times a pipeline stage; errors are counted by exception type and re-raised."""
+    parent = _current_span.get()
+    trace_id = parent[0] if parent else uuid.uuid4().hex[:16]
+    span_id = uuid.uuid4().hex[:16]
+    token = _current_span.set((trace_id, span_id))
+    error = None
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        # Exception only, streamlit's rerun/stop signals are BaseExceptions and are not failures
+        error = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        _current_span.reset(token)
+        metrics.observe('stage', seconds, stage=stage, **labels)
+        if error is not None:
+            metrics.count('stage_errors', stage=stage, error=error, **labels)
+        _emit({'type': 'span', 'name': stage, 'trace_id': trace_id, 'span_id': span_id,
+               'parent_id': parent and parent[1], 'seconds': seconds, 'error': error, **labels})
+
+
+def timed(stage: str, **labels):
+    """Decorator form of span()."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
@@ -0,0 +1,106 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+import io
+
+import numpy as np
+
+import model_helper as mh
+
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_QUALITY = 85
+
+
+@dataclass
+class ProcessedUpload:
+    name: str
+    key: Optional[str]  # prediction cache key of the original bytes
+    thumbnail: bytes = field(repr=False)  # JPEG, handed to st.image as-is so reruns do not re-encode it
+    pixels: np.ndarray = field(repr=False)  # uint8 RGB at mh.IMG_SIZE, the model input before scaling
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.thumbnail) + self.pixels.nbytes
+
+
+def upload_id(uploaded_file):
+    # Streamlit's UploadedFile has a per-upload id, fall back to name + size for plain file objects
+    file_id = getattr(uploaded_file, 'id', None)
+    if file_id is not None:
+        return file_id
+    return getattr(uploaded_file, 'name', None), getattr(uploaded_file, 'size', None)
+
+
+def process_upload(uploaded_file, key_fn: Optional[Callable[[bytes], str]] = None,
+                   thumbnail_size: tuple = THUMBNAIL_SIZE) -> ProcessedUpload:
+    data = mh.read_bytes(uploaded_file)
+    # Decoded exactly like mh.load_image, the prediction cache key is shared with that path.
+    # The thumbnail comes from the same decode, so the file is only decoded once
+    img = mh.decode_image(io.BytesIO(data))
+
+    pixels = np.asarray(img.resize(mh.IMG_SIZE), dtype=np.uint8)
+    img.thumbnail(thumbnail_size)
+    buf = io.BytesIO()
+    img.save(buf, format='JPEG', quality=THUMBNAIL_QUALITY)
+
+    return ProcessedUpload(name=getattr(uploaded_file, 'name', ''), key=key_fn(data) if key_fn else None,
+                           thumbnail=buf.getvalue(), pixels=pixels)
+
+
+class UploadCache:
+    """Per-session LRU of decoded uploads (thumbnail + model input), bounded by total bytes rather than count."""
+
+    def __init__(self, max_bytes: int = 32 * 2**20, key_fn: Optional[Callable[[bytes], str]] = None,
+                 max_workers: int = 4):
+        self.max_bytes = max_bytes
+        self.key_fn = key_fn
+        self.max_workers = max_workers
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def get_many(self, uploaded_files: list) -> list:
+        ids = [upload_id(f) for f in uploaded_files]
+        missing = [idx for idx, file_id in enumerate(ids) if file_id not in self._entries]
+        self.hits += len(ids) - len(missing)
+        self.misses += len(missing)
+
+        # Decoding is the expensive part and PIL releases the GIL, so new uploads are processed in parallel
+        if missing:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                processed = executor.map(lambda idx: process_upload(uploaded_files[idx], self.key_fn), missing)
+                for idx, upload in zip(missing, processed):
+                    self._put(ids[idx], upload)
+
+        results = []
+        for idx, file_id in enumerate(ids):
+            upload = self._entries.get(file_id)
+            if upload is None:
+                # Evicted while this batch was added (the batch alone is over budget), decode it again on demand
+                upload = process_upload(uploaded_files[idx], self.key_fn)
+            else:
+                self._entries.move_to_end(file_id)
+            results.append(upload)
+        return results
+
+    def retain(self, uploaded_files: list):
+        # Drop uploads that were removed from the file uploader
+        keep = {upload_id(f) for f in uploaded_files}
+        for file_id in [file_id for file_id in self._entries if file_id not in keep]:
+            self._bytes -= self._entries.pop(file_id).nbytes
+
+    def _put(self, file_id, upload: ProcessedUpload):
+        self._entries[file_id] = upload
+        self._bytes += upload.nbytes
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {'items': len(self._entries), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
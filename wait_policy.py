@@ -0,0 +1,92 @@
+from typing import Optional
+import time
+
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+import telemetry
+
+# Upper bounds per step, the waits return as soon as their condition holds
+DEFAULT_TIMEOUTS = {
+    'network_idle': 10,
+    'results': 10,
+    'show_more': 5,
+    'scroll': 3,
+    'grid_end': 5,
+}
+
+# Resource count, only meaningful once the document itself has finished loading
+NETWORK_ACTIVITY_JS = """
+if (document.readyState !== 'complete') return -1;
+return performance.getEntriesByType('resource').length;
+"""
+
+
+class WaitPolicy:
+    """Explicit-condition waits with per-step timeouts, recording how long each wait actually took."""
+
+    def __init__(self, timeouts: Optional[dict] = None, poll: float = 0.1, settle: float = 0.5):
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.poll = poll
+        self.settle = settle
+        self.timings = []
+        # Set by a scraper once a satisfied wait showed its result list settled short of the limit, as opposed to
+        # a wait that timed out, so callers can tell "ran out of results" from "too slow to tell"
+        self.exhausted = False
+
+    def _wait(self, driver: webdriver.Firefox, step: str, condition):
+        start = time.perf_counter()
+        try:
+            result = WebDriverWait(driver, self.timeouts[step], poll_frequency=self.poll).until(condition)
+            satisfied = True
+        except TimeoutException:
+            result = None
+            satisfied = False
+        seconds = time.perf_counter() - start
+        self.timings.append({'step': step, 'seconds': seconds, 'satisfied': satisfied})
+        telemetry.observe('browser_wait', seconds, step=step, satisfied=satisfied)
+        return result
+
+    def _stable(self, read_value):
+        # Condition that holds once read_value() has not changed for `settle` seconds
+        state = {'value': None, 'since': None}
+
+        def condition(driver):
+            value = read_value(driver)
+            now = time.monotonic()
+            if value != state['value']:
+                state['value'] = value
+                state['since'] = now
+                return False
+            return now - state['since'] >= self.settle
+
+        return condition, state
+
+    def until_present(self, driver: webdriver.Firefox, css_selector: str, step: str = 'results') -> bool:
+        return self._wait(driver, step, lambda d: d.execute_script(
+            'return document.querySelector(arguments[0]) !== null', css_selector)) is not None
+
+    def until_clickable(self, driver: webdriver.Firefox, by: str, locator: str, step: str):
+        return self._wait(driver, step, EC.element_to_be_clickable((by, locator)))
+
+    def until_count_above(self, driver: webdriver.Firefox, count_js: str, count: int, step: str = 'scroll') -> int:
+        def grew(d):
+            value = d.execute_script(count_js)
+            return value if value > count else False
+
+        new_count = self._wait(driver, step, grew)
+        return new_count if new_count is not None else count
+
+    def until_count_stable(self, driver: webdriver.Firefox, count_js: str, step: str = 'results') -> int:
+        condition, state = self._stable(lambda d: d.execute_script(count_js))
+        self._wait(driver, step, condition)
+        return state['value'] or 0
+
+    def until_network_idle(self, driver: webdriver.Firefox, step: str = 'network_idle') -> bool:
+        condition, state = self._stable(lambda d: d.execute_script(NETWORK_ACTIVITY_JS))
+        return self._wait(driver, step, lambda d: condition(d) and state['value'] >= 0) is not None
+
+    def total_seconds(self) -> float:
+        return sum(t['seconds'] for t in self.timings)